@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+# Decodes the audio once and writes segments of it to stdout as one wav.
+# Segments are cut by sample offsets while the decoded audio is streamed.
+
+import logging
+import optparse
+import raw_video
+import struct
+import sys
+
+CHUNK_SAMPLE_NUM = 48000
+# neroAacEnc delays the audio by 2624 samples at 48 kHz.
+DEFAULT_SKIP_SAMPLE_NUM = 2624
+SKIP_SAMPLE_RATE = 48000
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] start:duration [start:duration ...] > out.wav')
+    parser.add_option('--input', dest='input', default='in.aac',
+                      help='Audio file to cut.')
+    parser.add_option('--skip_samples', dest='skip_samples', type='int',
+                      default=DEFAULT_SKIP_SAMPLE_NUM,
+                      help=('Samples at 48 kHz to drop from the head of the'
+                            ' output to compensate the encoder delay.'))
+    (options, args) = parser.parse_args(args)
+
+    if not args:
+        raise ValueError('Specify segments to cut.')
+    options.segments = []
+    for arg in args:
+        (start, duration) = map(float, arg.split(':'))
+        if start < 0 or duration < 0:
+            raise ValueError('Invalid segment: %s' % arg)
+        options.segments.append((start, duration))
+    return options
+
+
+def ReadExactly(input_file, size):
+    data = input_file.read(size)
+    if len(data) != size:
+        raise IOError('Unexpected end of the wav.')
+    return data
+
+
+def ReadWaveHeader(input_file):
+    # Returns the raw fmt chunk, the number of channels, the sampling rate
+    # and the block size. The input is left at the head of samples.
+    (riff, _, wave) = struct.unpack('<4sI4s', ReadExactly(input_file, 12))
+    if riff != 'RIFF' or wave != 'WAVE':
+        raise IOError('Invalid RIFF format.')
+    fmt_chunk = None
+    while True:
+        (chunk_id, chunk_size) = struct.unpack(
+            '<4sI', ReadExactly(input_file, 8))
+        if chunk_id == 'data':
+            break
+        data = ReadExactly(input_file, chunk_size + chunk_size % 2)
+        if chunk_id == 'fmt ':
+            fmt_chunk = data[:chunk_size]
+    if fmt_chunk is None:
+        raise IOError('No fmt chunk.')
+    (channel_num, sampling_rate) = struct.unpack('<2xHI', fmt_chunk[:8])
+    (block_size,) = struct.unpack('<H', fmt_chunk[12:14])
+    return (fmt_chunk, channel_num, sampling_rate, block_size)
+
+
+def WriteWaveHeader(output_file, fmt_chunk, data_size):
+    output_file.write(struct.pack(
+        '<4sI4s4sI', 'RIFF', 4 + 8 + len(fmt_chunk) + 8 + data_size, 'WAVE',
+        'fmt ', len(fmt_chunk)))
+    output_file.write(fmt_chunk)
+    output_file.write(struct.pack('<4sI', 'data', data_size))
+
+
+def GetSampleRanges(segments, sampling_rate, skip_sample_num):
+    # Returns [start, end) of samples of segments. Leading samples of the
+    # output are skipped from the first segments.
+    ranges = []
+    last_end = 0
+    for (start, duration) in segments:
+        start_sample = int(round(start * sampling_rate))
+        end_sample = start_sample + int(round(duration * sampling_rate))
+        if start_sample < last_end:
+            raise ValueError('Segments should be sorted without overlaps.')
+        last_end = end_sample
+        skip = min(skip_sample_num, end_sample - start_sample)
+        skip_sample_num = skip_sample_num - skip
+        if start_sample + skip < end_sample:
+            ranges.append((start_sample + skip, end_sample))
+    return ranges
+
+
+def CutSamples(input_file, output_file, ranges, block_size):
+    position = 0
+    for (start, end) in ranges:
+        while position < end:
+            sample_num = min(CHUNK_SAMPLE_NUM, end - position)
+            data = input_file.read(sample_num * block_size)
+            if len(data) < block_size:
+                logging.warning('The audio ends at sample %d.', position)
+                return
+            sample_num = len(data) // block_size
+            if position + sample_num > start:
+                offset = max(0, start - position)
+                output_file.write(
+                    data[offset * block_size:sample_num * block_size])
+            position = position + sample_num
+
+
+def Main():
+    options = ParseOptions()
+    (process, log_file) = raw_video.OpenRawVideo(
+        ['ffmpeg', '-i', options.input,
+         '-vn', '-acodec', 'pcm_s16le', '-f', 'wav', 'pipe:1'])
+    try:
+        (fmt_chunk, _, sampling_rate, block_size) = ReadWaveHeader(
+            process.stdout)
+    except IOError:
+        (_, output) = raw_video.CloseRawVideo(process, log_file)
+        logging.error(output)
+        logging.error('Failed to decode %s.', options.input)
+        sys.exit(1)
+    skip_sample_num = int(round(
+        options.skip_samples * sampling_rate / float(SKIP_SAMPLE_RATE)))
+    ranges = GetSampleRanges(options.segments, sampling_rate, skip_sample_num)
+    # The size is an estimate if the audio is shorter than the segments.
+    data_size = sum(end - start for (start, end) in ranges) * block_size
+    WriteWaveHeader(sys.stdout, fmt_chunk, data_size)
+    CutSamples(process.stdout, sys.stdout, ranges, block_size)
+    sys.stdout.flush()
+    # Drain the rest of the audio so that ffmpeg exits by itself and its
+    # status tells a decode failure.
+    while process.stdout.read(CHUNK_SAMPLE_NUM * block_size):
+        pass
+    (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+    if returncode != 0:
+        logging.error(output)
+        logging.error('Failed to decode %s.', options.input)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+# Compares audio_cutter.py with the baseline, which cut each segment by
+# ffmpeg -ss -t, concatenated them by sox and dropped the delay of
+# neroAacEnc from the head.
+
+import StringIO
+import random
+import struct
+import unittest
+
+import audio_cutter
+
+SAMPLING_RATE = 48000
+BLOCK_SIZE = 4
+
+
+def GetBaselineSamples(segments, sampling_rate, skip_sample_num):
+    samples = []
+    for (start, duration) in segments:
+        start_sample = int(round(start * sampling_rate))
+        samples.extend(xrange(
+            start_sample, start_sample + int(round(duration * sampling_rate))))
+    return samples[skip_sample_num:]
+
+
+def CreateSegments(random_generator, num):
+    segments = []
+    start = 0.0
+    for _ in xrange(num):
+        start = start + random_generator.uniform(0, 3)
+        duration = random_generator.uniform(0, 0.2)
+        segments.append((start, duration))
+        start = start + duration
+    return segments
+
+
+def CreatePcm(sample_num):
+    # Each block has its sample index.
+    return ''.join(struct.pack('<I', i) for i in xrange(sample_num))
+
+
+class AudioCutterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(0)
+
+    def testGetSampleRanges(self):
+        for _ in xrange(100):
+            segments = CreateSegments(self.random, 5)
+            skip_sample_num = self.random.choice(
+                [0, audio_cutter.DEFAULT_SKIP_SAMPLE_NUM, 20000])
+            samples = []
+            for (start, end) in audio_cutter.GetSampleRanges(
+                    segments, SAMPLING_RATE, skip_sample_num):
+                self.assertLess(start, end)
+                samples.extend(xrange(start, end))
+            self.assertEqual(
+                GetBaselineSamples(segments, SAMPLING_RATE, skip_sample_num),
+                samples)
+
+    def testGetSampleRangesRejectsOverlaps(self):
+        self.assertRaises(
+            ValueError, audio_cutter.GetSampleRanges,
+            [(1.0, 1.0), (1.5, 1.0)], SAMPLING_RATE, 0)
+
+    def testCutSamples(self):
+        sample_num = 16 * SAMPLING_RATE
+        input_data = CreatePcm(sample_num)
+        for _ in xrange(20):
+            segments = CreateSegments(self.random, 5)
+            output_file = StringIO.StringIO()
+            audio_cutter.CutSamples(
+                StringIO.StringIO(input_data), output_file,
+                audio_cutter.GetSampleRanges(
+                    segments, SAMPLING_RATE,
+                    audio_cutter.DEFAULT_SKIP_SAMPLE_NUM),
+                BLOCK_SIZE)
+            expected = [i for i in GetBaselineSamples(
+                segments, SAMPLING_RATE, audio_cutter.DEFAULT_SKIP_SAMPLE_NUM)
+                        if i < sample_num]
+            output = output_file.getvalue()
+            self.assertEqual(
+                expected,
+                list(struct.unpack('<%dI' % (len(output) // BLOCK_SIZE),
+                                   output)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,352 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# Benchmark of CM detection stages on synthetic recordings.
+#
+# Fixtures are generated by ffmpeg lavfi sources under --work_dir and
+# reused on later runs. Stages run the same command lines as mecenc through
+# stage_timer.py in a fresh working directory, so the numbers measure the
+# shipped pipeline. Stages before the requested ones run but are not
+# reported.
+
+import json
+import logging
+import multiprocessing
+import optparse
+import os
+import platform
+import shutil
+import stage_timer
+import subprocess
+import sys
+import tempfile
+
+SCRIPT_DIRNAME = os.path.dirname(os.path.abspath(__file__))
+LOGO_DIRNAME = os.path.join(SCRIPT_DIRNAME, '..', 'logo')
+
+FIXTURE_INFO_FILENAME = 'fixture.json'
+INPUT_FILENAME = 'in.ts'
+LOGO_NAME = 'logo'
+WORKING_DIRNAME = 'enc'
+TIMINGS_FILENAME = 'timings.json'
+# In the order of mecenc.
+STAGES = (
+    'ts_dumper',
+    'scene_change_detector',
+    'sponsor_detector',
+    'logo_extractor',
+)
+# logo_extractor accepts ranges of these seconds.
+LOGO_EXTRACTOR_MIN_RANGE = 300
+LOGO_EXTRACTOR_MAX_RANGE = 1200
+
+MOVIE_WIDTH = 1920
+MOVIE_HEIGHT = 1080
+# Cuts every 15 seconds like TV commercials, with silence around them.
+SCENE_DURATION = 15
+SILENCE_DURATION = 0.6
+# Black and white flashes right after some cuts.
+FLASH_INTERVAL = 60
+FLASH_DURATION = 0.1
+# The logo appears except in the first scene of every FLASH_INTERVAL.
+LOGO_INFO = {
+    'offset_x': 1244,
+    'offset_y': 76,
+    'width': 144,
+    'height': 32,
+}
+LOGO_BOXES = ((8, 6, 40, 20), (56, 6, 36, 20), (100, 10, 32, 12))
+# "提供" card in the sponsor mark area of scene_change_detector.
+SPONSOR_INTERVAL = 120
+SPONSOR_DURATION = 6
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('--lengths', dest='lengths', default='300,900,1800',
+                      help='Comma-separated show lengths in sec.')
+    parser.add_option('--stages', dest='stages', default=','.join(STAGES),
+                      help='Comma-separated stages to report.')
+    parser.add_option('--jobs', dest='jobs', type='int', default=0,
+                      help=('--jobs of stages as mecenc passes them. 0 means'
+                            ' the number of CPUs.'))
+    parser.add_option('--work_dir', dest='work_dir', default=None,
+                      help=('Directory to keep fixtures. A temporary'
+                            ' directory is used and removed if not set.'))
+    parser.add_option('--font_file', dest='font_file', default=None,
+                      help=('Japanese font for the sponsor card. The sponsor'
+                            ' card is not rendered if not set.'))
+    parser.add_option('--output', dest='output', default='-',
+                      help='JSON output filename. "-" for stdout.')
+    (options, _) = parser.parse_args(args)
+
+    options.lengths = [int(length) for length in options.lengths.split(',')]
+    if any(length < SCENE_DURATION * 2 for length in options.lengths):
+        raise ValueError(
+            'Lengths should be at least %d sec.' % (SCENE_DURATION * 2))
+    options.stages = options.stages.split(',')
+    for stage in options.stages:
+        if stage not in STAGES:
+            raise ValueError('Unknown stage: %s' % stage)
+    if options.jobs < 0:
+        raise ValueError('The number of jobs should not be negative.')
+    return options
+
+
+def GetBoxFilter(boxes, offset_x, offset_y, enable=None):
+    filters = []
+    for (x, y, width, height) in boxes:
+        box = 'drawbox=x=%d:y=%d:w=%d:h=%d:c=white@0.3:t=2' % (
+            offset_x + x, offset_y + y, width, height)
+        if enable is not None:
+            box = "%s:enable='%s'" % (box, enable)
+        filters.append(box)
+    return ','.join(filters)
+
+
+def GetVideoFilter(options, length):
+    filters = [
+        'hue=H=floor(t/%d)*2' % SCENE_DURATION,
+        ("drawbox=c=black:t=fill:enable='lt(mod(t,%d),%g)'" % (
+            FLASH_INTERVAL, FLASH_DURATION)),
+        ("drawbox=c=white:t=fill:enable='between(mod(t,%d),%d,%g)'" % (
+            FLASH_INTERVAL, FLASH_INTERVAL / 2,
+            FLASH_INTERVAL / 2 + FLASH_DURATION)),
+        GetBoxFilter(LOGO_BOXES, LOGO_INFO['offset_x'], LOGO_INFO['offset_y'],
+                     enable='gte(mod(t,%d),%d)' % (
+                         FLASH_INTERVAL, SCENE_DURATION)),
+    ]
+    if options.font_file:
+        enable = 'between(mod(t,%d),1,%d)' % (
+            SPONSOR_INTERVAL, 1 + SPONSOR_DURATION)
+        filters.extend([
+            "drawbox=x=808:y=160:w=304:h=220:c=black:t=fill:enable='%s'" % (
+                enable),
+            ("drawtext=fontfile=%s:text=%s:fontsize=120:fontcolor=white"
+             ":x=840:y=200:enable='%s'" % (
+                 options.font_file, u'提供'.encode('utf-8'), enable)),
+        ])
+    return ','.join(filters)
+
+
+def RunCommand(command):
+    process = subprocess.Popen(command, stdout=None, stderr=subprocess.PIPE)
+    output = process.communicate()[1]
+    if process.returncode != 0:
+        logging.error(output)
+        raise RuntimeError('Failed to run %s' % command[0])
+
+
+def CreateFixture(options, dirname, length):
+    logging.info('Creating a %d sec fixture in %s.', length, dirname)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    original_dirname = os.getcwd()
+    os.chdir(dirname)
+    try:
+        # MPEG-2 video and AAC audio in MPEG-TS like recordings.
+        RunCommand([
+            'ffmpeg',
+            '-f', 'lavfi',
+            '-i', 'testsrc2=size=%dx%d:rate=30000/1001:duration=%d' % (
+                MOVIE_WIDTH, MOVIE_HEIGHT, length),
+            '-f', 'lavfi',
+            '-i', ("sine=frequency=1000:sample_rate=48000:duration=%d"
+                   ",volume=volume=0:enable='lt(mod(t+%g,%d),%g)'" % (
+                       length, SILENCE_DURATION / 2, SCENE_DURATION,
+                       SILENCE_DURATION)),
+            '-map', '0:v',
+            '-filter:v', GetVideoFilter(options, length),
+            '-vcodec', 'mpeg2video', '-q:v', '4',
+            '-flags', '+ilme+ildct',
+            '-map', '1:a',
+            '-acodec', 'aac', '-ac', '2',
+            '-f', 'mpegts', '-y', INPUT_FILENAME])
+        RunCommand([
+            'ffmpeg',
+            '-f', 'lavfi',
+            '-i', 'color=c=black:size=%dx%d' % (
+                LOGO_INFO['width'], LOGO_INFO['height']),
+            '-filter:v', GetBoxFilter(LOGO_BOXES, 0, 0),
+            '-frames:v', '1', '-y', '%s.png' % LOGO_NAME])
+        # Same format as files in the logo directory.
+        with open('%s.txt' % LOGO_NAME, 'w') as logo_info_file:
+            for key in ('offset_x', 'offset_y', 'width', 'height'):
+                logo_info_file.write('%s: %d\n' % (key, LOGO_INFO[key]))
+
+        with open(FIXTURE_INFO_FILENAME, 'w') as info_file:
+            json.dump({
+                'length': length,
+                'font_file': options.font_file,
+                'frame_num': length * 30000 // 1001,
+            }, info_file)
+    finally:
+        os.chdir(original_dirname)
+
+
+def LoadFixtureInfo(dirname):
+    filename = os.path.join(dirname, FIXTURE_INFO_FILENAME)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename) as info_file:
+        return json.load(info_file)
+
+
+def IsFixtureReady(options, dirname, length):
+    info = LoadFixtureInfo(dirname)
+    return (info is not None and info['length'] == length and
+            info['font_file'] == options.font_file)
+
+
+def GetLogoName(fixture_dirname):
+    # Logo names are looked up in the logo directory.
+    return os.path.relpath(
+        os.path.join(fixture_dirname, LOGO_NAME), LOGO_DIRNAME)
+
+
+def GetLogoExtractorRange(length):
+    return min(length, LOGO_EXTRACTOR_MAX_RANGE)
+
+
+def GetStageCommand(options, stage, fixture_dirname, length):
+    # The same command lines as mecenc without --scenefile.
+    input_filename = os.path.join(fixture_dirname, INPUT_FILENAME)
+    if stage == 'ts_dumper':
+        return '%s/ts_dumper.pl "%s"' % (SCRIPT_DIRNAME, input_filename)
+    if stage == 'scene_change_detector':
+        return ('%s/scene_change_detector.py --stream=True --jobs=%d'
+                ' --logo_info=%s' % (SCRIPT_DIRNAME, options.jobs,
+                                     GetLogoName(fixture_dirname)))
+    if stage == 'sponsor_detector':
+        return '%s/sponsor_detector/sponsor_detector_driver.py --jobs=%d' % (
+            SCRIPT_DIRNAME, options.jobs)
+    # As README describes.
+    return '%s/../logo_extractor "%s" "%s.txt" 0 %d' % (
+        SCRIPT_DIRNAME, input_filename,
+        os.path.join(fixture_dirname, LOGO_NAME),
+        GetLogoExtractorRange(length))
+
+
+def GetStageDependency(stage):
+    # Returns the stage writing inputs of |stage|, or None.
+    return {
+        'scene_change_detector': 'ts_dumper',
+        'sponsor_detector': 'scene_change_detector',
+    }.get(stage)
+
+
+def GetSkipReason(stage, length):
+    if stage == 'ts_dumper':
+        for binary in ('ts_cleaner', 'silence_detector'):
+            if not os.path.isfile(
+                    os.path.join(SCRIPT_DIRNAME, binary, binary)):
+                return '%s is not built.' % binary
+    elif stage == 'sponsor_detector':
+        if not os.path.isfile(
+                os.path.join(SCRIPT_DIRNAME, 'sponsor_detector',
+                             'sponsor_detector')):
+            return 'sponsor_detector is not built.'
+        if subprocess.call('which tesseract > /dev/null', shell=True) != 0:
+            return 'tesseract is not found.'
+    elif stage == 'logo_extractor':
+        if length < LOGO_EXTRACTOR_MIN_RANGE:
+            return 'logo_extractor needs %d sec.' % LOGO_EXTRACTOR_MIN_RANGE
+    return None
+
+
+def RunStage(options, stage, fixture_dirname, length, working_dirname):
+    # Runs |stage| by stage_timer.py as mecenc does and returns its timings.
+    command = GetStageCommand(options, stage, fixture_dirname, length)
+    logging.info('Running %s on the %d sec fixture.', stage, length)
+    returncode = subprocess.call([
+        os.path.join(SCRIPT_DIRNAME, 'stage_timer.py'),
+        '--name=%s' % stage,
+        '--timings=%s' % TIMINGS_FILENAME,
+        '--', command], cwd=working_dirname)
+    if returncode != 0:
+        raise RuntimeError('Failed to run %s.' % stage)
+    timings = stage_timer.LoadTimings(
+        os.path.join(working_dirname, TIMINGS_FILENAME))
+    return timings['stages'][-1]
+
+
+def BenchmarkStages(options, fixture_dirname, length):
+    # Stages run in a fresh working directory with stages they depend on.
+    working_dirname = os.path.join(fixture_dirname, WORKING_DIRNAME)
+    if os.path.exists(working_dirname):
+        shutil.rmtree(working_dirname)
+    os.makedirs(working_dirname)
+    required_stages = set()
+    for stage in options.stages:
+        while stage is not None:
+            required_stages.add(stage)
+            stage = GetStageDependency(stage)
+
+    frame_num = LoadFixtureInfo(fixture_dirname)['frame_num']
+    skip_reasons = {}
+    results = []
+    for stage in STAGES:
+        if stage not in required_stages:
+            continue
+        dependency = GetStageDependency(stage)
+        if dependency in skip_reasons:
+            skip_reason = '%s is skipped.' % dependency
+        else:
+            skip_reason = GetSkipReason(stage, length)
+        result = {'stage': stage, 'length': length}
+        if skip_reason is not None:
+            logging.warning('Skip %s: %s', stage, skip_reason)
+            skip_reasons[stage] = skip_reason
+            result['skipped'] = skip_reason
+        else:
+            timing = RunStage(
+                options, stage, fixture_dirname, length, working_dirname)
+            for key in ('wall_seconds', 'user_seconds', 'system_seconds',
+                        'max_rss_kb', 'bytes_written'):
+                result[key] = timing[key]
+            result['frames'] = frame_num
+            if stage == 'logo_extractor':
+                result['frames'] = (
+                    GetLogoExtractorRange(length) * 30000 // 1001)
+            result['frames_per_second'] = (
+                result['frames'] / result['wall_seconds']
+                if result['wall_seconds'] > 0 else 0)
+        if stage in options.stages:
+            results.append(result)
+    return results
+
+
+def Main():
+    options = ParseOptions()
+    work_dirname = options.work_dir or tempfile.mkdtemp(prefix='mecenc_bench')
+    results = []
+    try:
+        for length in options.lengths:
+            fixture_dirname = os.path.abspath(
+                os.path.join(work_dirname, '%06d' % length))
+            if not IsFixtureReady(options, fixture_dirname, length):
+                CreateFixture(options, fixture_dirname, length)
+            results.extend(
+                BenchmarkStages(options, fixture_dirname, length))
+    finally:
+        if options.work_dir is None:
+            shutil.rmtree(work_dirname)
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'results': results,
+    }
+    if options.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(options.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+            output_file.write('\n')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    Main()
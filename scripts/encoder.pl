@@ -4,16 +4,35 @@ use strict;
 use warnings;
 use utf8;
 
+use File::Basename;
+use File::Spec;
 use Getopt::Long;
+use List::Util qw/max min/;
 use POSIX;
+use constant {
+    FRAME_DURATION => 1001.0 / 30000.0,
+};
 
 my %options;
-GetOptions(\%options, qw/no_scale keep_fps interlaced x265 crf=f/) or die;
+$options{jobs} = 1;
+GetOptions(\%options,
+           qw/no_scale keep_fps interlaced x265 crf=f jobs=i clean/)
+    or die;
+
+my $script_dirname = File::Basename::dirname(File::Spec->rel2abs($0));
+$script_dirname =~ s/ /\\ /g;
 
 my $basename = 'in';
 my $video_filename = 'in.mp4v';
-die "No such file. [$video_filename]" unless -f $video_filename;
-my $audio_filename = 'in.wav';
+# ts_dumper.pl --direct leaves an index of the original input instead.
+my $video_index = loadVideoIndex('in.index');
+# Segments are decoded in parallel from the keyframes before them. Without a
+# trustworthy index, all of them are decoded by one pass as before.
+my $key_frames = loadKeyFrames('in.frames');
+die "No such file. [$video_filename]"
+    unless -f $video_filename || defined $video_index;
+# The original audio stream. Segments are decoded from it.
+my $audio_filename = 'in.aac';
 die "No such file. [$audio_filename]" unless -f $audio_filename;
 my $scene_filename = 'scene.txt';
 die "No such file. [$scene_filename]" unless -f $scene_filename;
@@ -63,8 +82,26 @@ my @frame_list = ();
 }
 
 my $pix_fmt_option = getPixFmtOption(\%options);
-my $video_command = qq|ffmpeg -i "$video_filename" |;
+my @seek_frames = ();
+my $is_seekable = defined $key_frames;
+for my $frame (@frame_list) {
+    last unless $is_seekable;
+    my ($seek_frame, $seek_time) = getSeekFrame(POSIX::ceil($frame->[0]));
+    if ($seek_frame > 0 && !isSeekAccurate($seek_time)) {
+        print STDERR "A seek to frame $seek_frame decodes another frame." .
+            " Segments are decoded by one pass.\n";
+        $is_seekable = 0;
+    }
+    push @seek_frames, [$seek_frame, $seek_time];
+}
+# Segments are encoded by independent processes sharing the cores, or as
+# outputs of one decode.
+my $job_num = $is_seekable ? getJobNum($options{jobs}, scalar @frame_list) : 1;
+my $thread_num = max(1, POSIX::floor(getCpuNum() / $job_num));
+my $original_height = getOriginalHeight(getVideoInput(undef));
 my $index = 1;
+my @video_commands;
+my $video_command = 'ffmpeg ' . getVideoInput(undef);
 my @video_temp_filenames;
 for my $frame (@frame_list) {
     my $start = POSIX::ceil($frame->[0]);
@@ -73,29 +110,35 @@ for my $frame (@frame_list) {
     my $video_option = '';
     if ($options{x265}) {
         my $crf = $options{crf} // 19;
+        my $pools_param = $job_num > 1 ? ":pools=$thread_num" : '';
         $video_option =
             "-vcodec libx265 -preset medium -f hevc $pix_fmt_option " .
             "-x265-params " .
-                "crf=$crf:colorprim=bt709:transfer=bt709:colormatrix=bt709 ";
+                "crf=$crf:colorprim=bt709:transfer=bt709:colormatrix=bt709" .
+                "$pools_param ";
         $temp_filename = sprintf("%s%02d.265", $basename, $index);
     } else {
         my $crf = $options{crf} // 18;
+        my $threads_option = $job_num > 1 ? "-threads $thread_num " : '';
         $video_option =
             "-vcodec libx264 -crf $crf -preset slow -tune animation " .
-            "-f mp4 $pix_fmt_option -deblock 0:0 -qmin 10 " .
+            "-f mp4 $pix_fmt_option -deblock 0:0 -qmin 10 $threads_option" .
             "-x264-params colorprim=bt709:transfer=bt709:colormatrix=bt709 ";
         $temp_filename = sprintf("%s%02d.mp4v", $basename, $index);
     }
     die "A temp file is already exists. [$temp_filename]" if -e $temp_filename;
     push @video_temp_filenames, $temp_filename;
-    $video_command .= qq|-an $video_option |;
-    my $filter_v = qq|-filter:v trim=start_frame=$start:end_frame=$end|;
+
+    my ($seek_frame, $seek_time) =
+        $is_seekable ? @{$seek_frames[$index - 1]} : (0, 0);
+    my $video_output = qq| -an $video_option |;
+    my $filter_v = sprintf('-filter:v trim=start_frame=%d:end_frame=%d',
+                           $start - $seek_frame, $end - $seek_frame);
     if ($options{interlaced}) {
-        $video_command .= qq|-flags +ilme+ildct |;
+        $video_output .= qq|-flags +ilme+ildct |;
     } elsif ($options{keep_fps}) {
         $filter_v .= ',yadif';
     } else {
-        my $original_height = getOriginalHeight($video_filename);
         my $y0 = POSIX::floor($original_height / 4.0);
         my $y1 = POSIX::ceil($original_height * 3.0 / 4.0);
         $filter_v .=
@@ -104,13 +147,28 @@ for my $frame (@frame_list) {
     }
     if (!$options{no_scale}) {
         $filter_v .= qq|,scale=width=1280:height=720|;
-        $video_command .= qq|-sws_flags lanczos+accurate_rnd |;
+        $video_output .= qq|-sws_flags lanczos+accurate_rnd |;
     }
     $filter_v .= qq|,lutyuv=y=clipval,setpts=PTS-STARTPTS|;
-    $video_command .= qq|$filter_v "$temp_filename" |;
+    $video_output .= qq|$filter_v "$temp_filename"|;
+    if ($is_seekable) {
+        # Seek to half a frame before the first frame to decode, so that
+        # trim counts frames from there.
+        push @video_commands, 'ffmpeg ' . getVideoInput(
+            $seek_frame > 0 ? $seek_time - 0.5 * FRAME_DURATION : undef) .
+            $video_output;
+    } else {
+        $video_command .= $video_output;
+    }
     $index++;
 }
-`$video_command`;
+push @video_commands, $video_command unless $is_seekable;
+runCommands(\@video_commands, $job_num);
+# Audio starts at the start of the original video.
+my $video_delay = defined $video_index ?
+    $video_index->{video_start} : getVideoDelay($video_filename);
+# The copied video is read only by segments. The input is kept with --direct.
+removeTemps($video_filename) unless defined $video_index;
 
 open my $concat_fh, '>', $concat_filename
     or die "Failed to open concat file. [$concat_filename]";
@@ -128,6 +186,7 @@ if ($options{x265}) {
     $concat_command .= qq|-f mp4 "$video_result_filename" |
 }
 `$concat_command`;
+die "Failed to concatenate segments." if $?;
 
 my $fps = 24000.0 / 1001;
 my $fps_str = '24000/1001';
@@ -136,27 +195,25 @@ if ($options{interlaced} || $options{keep_fps}) {
     $fps_str = '30000/1001';
 }
 
-$index = 1;
-my @audio_commands = ();
-my $sox_command = 'sox ';
-my $video_delay = getVideoDelay($video_filename);
-my @durations = ();
-for my $frame (@frame_list) {
-    my $start = $frame->[0] * 1001.0 / 30000.0 + $video_delay;
-    my $duration = dumpDuration(shift(@video_temp_filenames), $fps);
-    push @durations, $duration;
-    my $temp_filename = sprintf("%s%02d.wav", $basename, $index);
-    `ffmpeg -i "$audio_filename" -ss $start -t $duration "$temp_filename"`;
-    $sox_command .= qq|"$temp_filename" |;
-    $index++;
+# Audio of all segments is cut from one decode of the source.
+my @durations = dumpDurations(\@video_temp_filenames, $fps);
+removeTemps(@video_temp_filenames, $concat_filename);
+my @audio_segments = ();
+for (my $i = 0; $i <= $#frame_list; ++$i) {
+    my $start = $frame_list[$i]->[0] * FRAME_DURATION + $video_delay;
+    push @audio_segments, sprintf('%.6f:%.6f', $start, $durations[$i]);
 }
 writeChapterFile($chapter_filename, \@durations);
 
-my $audio_delay = 2624.0 / 48000.0;  # 2624 samples delay by neroAacEnc.
-$sox_command .=
-    qq#-t wav - | ffmpeg -i - -ss $audio_delay -c copy -f wav pipe: # .
-    qq#|neroAacEnc -q 0.55 -ignorelength -if - -of "$audio_result_filename" #;
-`$sox_command`;
+# audio_cutter.py drops 2624 samples of the delay by neroAacEnc. The pipeline
+# fails if either of them fails.
+my $audio_command =
+    qq#$script_dirname/audio_cutter.py --input="$audio_filename"# .
+    qq# @audio_segments# .
+    qq# |neroAacEnc -q 0.55 -ignorelength -if - -of "$audio_result_filename" #;
+system('bash', '-o', 'pipefail', '-c', $audio_command) == 0
+    or die "Failed to encode the audio.";
+removeTemps($audio_filename);
 
 if ($options{x265}) {
     my $muxer_command =
@@ -166,6 +223,7 @@ if ($options{x265}) {
         qq|-i "$audio_result_filename" | .
         qq|-o "$output_filename" |;
     `$muxer_command`;
+    die "Failed to mux." if $?;
 } else {
     # L-SMASH bug? Failed to mux. Use ffmpeg instead.
     # Commit: 7124bbeccb552021f2e6b31cbd923eeff7322cb5
@@ -173,10 +231,20 @@ if ($options{x265}) {
         qq|ffmpeg -i "$video_result_filename" -i "$audio_result_filename" | .
         qq|-c copy -movflags faststart "$output_filename" |;
     `$muxer_command`;
+    die "Failed to mux." if $?;
 }
+removeTemps($video_result_filename, $audio_result_filename);
 
 exit;
 
+# Removes files which are not read any more with --clean.
+sub removeTemps {
+    return unless $options{clean};
+    for my $filename (@_) {
+        unlink($filename) if -f $filename;
+    }
+}
+
 sub getVideoDelay {
     my $a = shift;
     my $line = `ffmpeg -i "$a" 2>&1 1| grep "Duration: "`;
@@ -185,31 +253,144 @@ sub getVideoDelay {
     return $sec;
 }
 
+# Returns ffmpeg options to read the video from $seek_time seconds after the
+# first frame.
+sub getVideoInput {
+    my $seek_time = shift;
+    if (!defined $video_index) {
+        my $seek_option =
+            defined $seek_time ? sprintf('-ss %.6f ', $seek_time) : '';
+        return qq|$seek_option-i "$video_filename"|;
+    }
+    # The original input starts earlier than its video.
+    my $seek_option = defined $seek_time ?
+        sprintf('-ss %.6f ', $seek_time + $video_index->{video_start}) : '';
+    return qq|$seek_option| .
+        qq|-skip_initial_bytes $video_index->{skip_initial_bytes} | .
+        qq|-i "$video_index->{input}"|;
+}
+
+# Returns the frame to seek to for decoding from $frame and its time from the
+# first frame.
+sub getSeekFrame {
+    my $frame = shift;
+    if (defined $key_frames) {
+        my ($frames, $times) = @$key_frames[0, 1];
+        my ($low, $high) = (0, scalar @$frames);
+        while ($low < $high) {
+            my $middle = int(($low + $high) / 2);
+            if ($frames->[$middle] <= $frame) {
+                $low = $middle + 1;
+            } else {
+                $high = $middle;
+            }
+        }
+        return ($frames->[$low - 1], $times->[$low - 1]) if $low > 0;
+    }
+    return (0, 0);
+}
+
+# Returns true if a seek to $seek_time from the first frame decodes the frame
+# at the time first, as the index says. Timestamps are kept by -copyts to
+# compare with the index.
+sub isSeekAccurate {
+    my $seek_time = shift;
+    my $input = getVideoInput($seek_time - 0.5 * FRAME_DURATION);
+    my $command =
+        qq|ffmpeg -copyts $input -vframes 1 -filter:v showinfo -an -f null -|;
+    my $output = `$command 2>&1`;
+    return 0 unless
+        $output =~ m/\sn:\s*0\s+pts:\s*-?\d+\s+pts_time:\s*(-?[\d.]+)/;
+    return abs($1 - $key_frames->[2] - $seek_time) <= 0.5 * FRAME_DURATION;
+}
+
+# Returns numbers and times from the first frame of keyframes in the frame
+# index by frame_index.py, and the time of the first frame. A seek by time
+# lands on the frame which trim counts from only if all frames are where
+# timestamps of FRAME_DURATION put them, so undef is returned for other frame
+# rates or PTS discontinuities.
+sub loadKeyFrames {
+    my $filename = shift;
+    return undef unless -f $filename;
+    open my $fh, '<', $filename or die "Failed to open $filename.";
+    my (@frames, @times);
+    my $first_time = undef;
+    my $expected_frame = 0;
+    my $is_regular = 1;
+    for my $line (<$fh>) {
+        chomp $line;
+        my ($frame, $time, $pos, $is_key) = split "\t", $line;
+        $first_time //= $time;
+        if ($frame != $expected_frame++ ||
+            abs($time - $first_time - $frame * FRAME_DURATION) >
+                0.5 * FRAME_DURATION) {
+            $is_regular = 0;
+            last;
+        }
+        if ($is_key) {
+            push @frames, $frame;
+            push @times, $time - $first_time;
+        }
+    }
+    close $fh;
+    if (!$is_regular) {
+        print STDERR "Irregular timestamps in $filename." .
+            " Segments are decoded by one pass.\n";
+        return undef;
+    }
+    return [\@frames, \@times, $first_time];
+}
+
+sub loadVideoIndex {
+    my $filename = shift;
+    return undef unless -f $filename;
+    open my $fh, '<', $filename or die "Failed to open $filename.";
+    my %index = ();
+    for my $line (<$fh>) {
+        chomp $line;
+        my ($key, $value) = split "\t", $line, 2;
+        $index{$key} = $value;
+    }
+    close $fh;
+    return \%index;
+}
+
 sub getOriginalHeight {
-    my $a = shift;
-    my $line = `ffmpeg -i "$a" 2>&1 1| grep "Stream #" | grep ": Video: "`;
+    my $input = shift;
+    my $line = `ffmpeg $input 2>&1 1| grep "Stream #" | grep ": Video: "`;
     my ($width, $height) = $line =~ m/(\d{2,})x(\d{2,})/;
     return $height;
 }
 
-sub dumpDuration {
-    my ($filename, $fps) = @_;
-    my $line = '';
-    if ($filename =~ m/\.265$/) {
-        my $temp_filename = $filename . '.tmp.mp4';
-        `ffmpeg -i "$filename" -c copy -f mp4 -y "$temp_filename"`;
-        $line = `ffmpeg -i "$temp_filename" 2>&1 1| grep "Duration: "`;
-        `rm $temp_filename`;
-    } else {
-        $line = `ffmpeg -i "$filename" 2>&1 1| grep "Duration: "`;
+# Probes durations of all files by one ffmpeg.
+sub dumpDurations {
+    my ($filenames, $fps) = @_;
+    my @probe_filenames = ();
+    for my $filename (@$filenames) {
+        if ($filename =~ m/\.265$/) {
+            my $temp_filename = $filename . '.tmp.mp4';
+            `ffmpeg -i "$filename" -c copy -f mp4 -y "$temp_filename"`;
+            push @probe_filenames, $temp_filename;
+        } else {
+            push @probe_filenames, $filename;
+        }
     }
+    my $inputs = join ' ', map {qq|-i "$_"|} @probe_filenames;
+    my @lines = `ffmpeg $inputs 2>&1 1| grep "Duration: "`;
+    for my $filename (@probe_filenames) {
+        `rm "$filename"` if $filename =~ m/\.tmp\.mp4$/;
+    }
+    die "Failed to probe durations." unless @lines == @$filenames;
 
-    $line =~ m/Duration: (\d+):(\d+):(\d+)\.(\d+)/;
-    my $sec = int($1) * 3600 + int($2) * 60 + int($3) + int($4) / 100.0;
-    my $frame_num = $sec * $fps;
-    ($frame_num + 0.5) =~ m/^(\d+)/;
-
-    return int($1) / $fps;
+    my @durations = ();
+    for my $line (@lines) {
+        $line =~ m/Duration: (\d+):(\d+):(\d+)\.(\d+)/;
+        my $sec = int($1) * 3600 + int($2) * 60 + int($3) + int($4) / 100.0;
+        my $frame_num = $sec * $fps;
+        ($frame_num + 0.5) =~ m/^(\d+)/;
+        push @durations, int($1) / $fps;
+    }
+    return @durations;
 }
 
 sub writeChapterFile {
@@ -236,6 +417,47 @@ sub writeChapterFile {
     close $fh;
 }
 
+sub getCpuNum {
+    my $cpu_num = `nproc`;
+    chomp $cpu_num;
+    return $cpu_num || 1;
+}
+
+sub getJobNum {
+    my ($jobs, $segment_num) = @_;
+    $jobs = getCpuNum() if $jobs == 0;
+    return max(1, min($jobs, $segment_num));
+}
+
+# Runs commands in at most $max_job_num processes at the same time.
+sub runCommands {
+    my ($commands, $max_job_num) = @_;
+    my %pids = ();
+    my $failed_num = 0;
+    for my $command (@$commands) {
+        if (scalar(keys %pids) >= $max_job_num) {
+            my $pid = wait();
+            $failed_num++ if $?;
+            delete $pids{$pid};
+        }
+        my $pid = fork();
+        die "Failed to fork. [$command]" unless defined $pid;
+        if ($pid == 0) {
+            # ffmpeg reads commands from stdin.
+            open(STDIN, '<', '/dev/null');
+            exec('/bin/sh', '-c', $command) or POSIX::_exit(127);
+        }
+        $pids{$pid} = 1;
+    }
+    while (%pids) {
+        my $pid = wait();
+        last if $pid == -1;
+        $failed_num++ if $?;
+        delete $pids{$pid};
+    }
+    die "Failed to run $failed_num commands." if $failed_num;
+}
+
 sub getPixFmtOption {
     my $options = shift;
     my @lines = ();
@@ -0,0 +1,62 @@
+import numpy
+import os
+
+# Per-field features of a whole movie are stored in chunks of this number of
+# fields, so that they can be written while the movie is decoded and any
+# range can be loaded later without decoding the movie again.
+CHUNK_FIELD_NUM = 3600
+
+
+def GetChunkFilename(dirname, chunk_index):
+    return '%s/%06d.npz' % (dirname, chunk_index)
+
+
+class FieldFeatureWriter(object):
+    def __init__(self, dirname):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.dirname = dirname
+        self.chunk_index = 0
+        self.histograms = []
+        self.black_white_energies = []
+
+    def Append(self, histograms, black_white_energy):
+        self.histograms.append(histograms)
+        self.black_white_energies.append(black_white_energy)
+        if len(self.histograms) == CHUNK_FIELD_NUM:
+            self._Flush()
+
+    def _Flush(self):
+        if not self.histograms:
+            return
+        numpy.savez(
+            GetChunkFilename(self.dirname, self.chunk_index),
+            histograms=numpy.array(self.histograms, dtype=numpy.float32),
+            black_white_energies=numpy.array(self.black_white_energies,
+                                             dtype=numpy.float64))
+        self.chunk_index = self.chunk_index + 1
+        self.histograms = []
+        self.black_white_energies = []
+
+    def Close(self):
+        self._Flush()
+
+
+def LoadFieldFeatures(dirname, start, end):
+    # Returns BGR histograms and black/white energies of fields in
+    # [start, end). Fields after the end of the movie are not returned.
+    histograms = []
+    black_white_energies = []
+    if start >= end:
+        return (histograms, black_white_energies)
+    for chunk_index in xrange(start // CHUNK_FIELD_NUM,
+                              (end - 1) // CHUNK_FIELD_NUM + 1):
+        filename = GetChunkFilename(dirname, chunk_index)
+        if not os.path.isfile(filename):
+            break
+        chunk = numpy.load(filename)
+        offset = chunk_index * CHUNK_FIELD_NUM
+        chunk_range = slice(max(0, start - offset), end - offset)
+        histograms.extend(chunk['histograms'][chunk_range])
+        black_white_energies.extend(chunk['black_white_energies'][chunk_range])
+    return (histograms, black_white_energies)
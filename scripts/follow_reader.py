@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+# Writes a recording to stdout while it is still being written, like
+# "tail -c +1 -f". Reading stops at the end of the file after the recorder
+# renames it (e.g. *.ts.filepart to *.ts) or it doesn't grow for a while.
+# Other files than *.filepart are complete and read to the end at once.
+
+import errno
+import logging
+import optparse
+import os
+import sys
+import time
+
+CHUNK_SIZE = 1024 * 1024
+RECORDING_SUFFIX = '.filepart'
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser(usage='%prog [options] input_file')
+    parser.add_option('--idle_timeout', dest='idle_timeout', type='float',
+                      default=60,
+                      help=('Seconds without growth of the input file to'
+                            ' regard the recording as finished.'))
+    parser.add_option('--poll_interval', dest='poll_interval', type='float',
+                      default=1,
+                      help='Seconds to wait for the input file to grow.')
+    (options, args) = parser.parse_args(args)
+
+    if len(args) != 1:
+        raise ValueError('Specify one input file.')
+    options.input = args[0]
+    return options
+
+
+def IsRenamed(filename, input_file):
+    # The recorder renames the file when the recording finishes. The opened
+    # file is still readable to the end.
+    try:
+        return os.stat(filename).st_ino != os.fstat(input_file.fileno()).st_ino
+    except OSError:
+        return True
+
+
+def Follow(options, input_file, output_file):
+    last_growth_time = time.time()
+    while options.input.endswith(RECORDING_SUFFIX):
+        data = input_file.read(CHUNK_SIZE)
+        if data:
+            output_file.write(data)
+            last_growth_time = time.time()
+            continue
+        if IsRenamed(options.input, input_file):
+            break
+        if time.time() - last_growth_time > options.idle_timeout:
+            logging.warning('%s has not grown for %g seconds.',
+                            options.input, options.idle_timeout)
+            break
+        output_file.flush()
+        time.sleep(options.poll_interval)
+
+    # The rest written before the rename.
+    while True:
+        data = input_file.read(CHUNK_SIZE)
+        if not data:
+            break
+        output_file.write(data)
+    output_file.flush()
+
+
+def Main():
+    options = ParseOptions()
+    try:
+        with open(options.input, 'rb') as input_file:
+            Follow(options, input_file, sys.stdout)
+    except IOError as e:
+        # The reader exited. It reports its own error.
+        if e.errno != errno.EPIPE:
+            raise
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
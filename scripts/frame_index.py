@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+# Builds in.frames, an index of video frames numbered as decoders output
+# them, with their PTS, byte offsets and keyframe flags. Seeks of analysis
+# and encoding start at the keyframe before their first frame instead of a
+# fixed number of frames before it. Packets are demuxed, and the video is
+# decoded once only to count frames. The index is not written if a packet
+# has no PTS or the count disagrees with the packets, e.g. for field-coded
+# streams, and readers fall back to decoding without it.
+
+import bisect
+import logging
+import movie_input
+import optparse
+import subprocess
+import sys
+
+INDEX_FILENAME = 'in.frames'
+
+_key_frames_cache = {}
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('--movie', dest='movie', default='in.mp4v',
+                      help='Movie to index unless in.index exists.')
+    parser.add_option('--output', dest='output', default=INDEX_FILENAME,
+                      help='Index file to write.')
+    (options, _) = parser.parse_args(args)
+    return options
+
+
+def ProbePackets(input_args):
+    # Returns (pts_time, pos, is_key) of video packets in the decode order.
+    # pts_time is None for packets without PTS.
+    command = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,pos,flags',
+        '-of', 'csv=p=0'] + input_args
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (output, error) = process.communicate()
+    if process.returncode != 0:
+        logging.error(error)
+        return None
+    packets = []
+    for line in output.splitlines():
+        (pts_time, pos, flags) = line.split(',')[:3]
+        packets.append((float(pts_time) if pts_time != 'N/A' else None,
+                        int(pos) if pos != 'N/A' else -1,
+                        flags.startswith('K')))
+    return packets
+
+
+def CountDecodedFrames(input_args):
+    # Returns the number of frames which the decoder outputs, or None.
+    command = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-count_frames',
+        '-show_entries', 'stream=nb_read_frames',
+        '-of', 'csv=p=0'] + input_args
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (output, error) = process.communicate()
+    if process.returncode != 0:
+        logging.error(error)
+        return None
+    try:
+        return int(output.strip().rstrip(','))
+    except ValueError:
+        logging.error('Unexpected frame count: %s', output)
+        return None
+
+
+def NumberFrames(packets):
+    # Decoders start at the first keyframe and drop frames displayed before
+    # it, which refer to frames before the keyframe. All packets should have
+    # PTS, and each of them is a frame.
+    first_key = next((i for (i, packet) in enumerate(packets) if packet[2]),
+                     None)
+    if first_key is None:
+        return []
+    first_pts_time = packets[first_key][0]
+    return sorted(packet for packet in packets[first_key:]
+                  if packet[0] >= first_pts_time)
+
+
+def WriteIndex(filename, frames):
+    with open(filename, 'w') as index_file:
+        for (frame_num, (pts_time, pos, is_key)) in enumerate(frames):
+            index_file.write('%d\t%.6f\t%d\t%d\n' % (
+                frame_num, pts_time, pos, is_key))
+
+
+def LoadKeyFrames(filename=INDEX_FILENAME):
+    # Returns frame numbers and PTS from the first frame of keyframes, or
+    # None without the index. Loaded once per process.
+    if filename not in _key_frames_cache:
+        key_frames = None
+        try:
+            with open(filename) as index_file:
+                key_frames = ([], [])
+                first_pts_time = None
+                for line in index_file:
+                    (frame_num, pts_time, _, is_key) = line.split('\t')
+                    if first_pts_time is None:
+                        first_pts_time = float(pts_time)
+                    if int(is_key):
+                        key_frames[0].append(int(frame_num))
+                        key_frames[1].append(float(pts_time) - first_pts_time)
+        except IOError:
+            pass
+        _key_frames_cache[filename] = key_frames
+    return _key_frames_cache[filename]
+
+
+def FindKeyFrame(frame_num, filename=INDEX_FILENAME):
+    # Returns the number and the time from the first frame of the last
+    # keyframe at or before |frame_num|, or None.
+    key_frames = LoadKeyFrames(filename)
+    if not key_frames:
+        return None
+    i = bisect.bisect_right(key_frames[0], frame_num) - 1
+    if i < 0:
+        return None
+    return (key_frames[0][i], key_frames[1][i])
+
+
+def Main():
+    options = ParseOptions()
+    packets = ProbePackets(movie_input.GetInputArgs(options.movie))
+    if packets is None:
+        logging.error('Failed to probe packets.')
+        sys.exit(1)
+    if any(packet[0] is None for packet in packets):
+        logging.warning('Packets without PTS. The index is not written.')
+        return
+    frames = NumberFrames(packets)
+    if not frames:
+        logging.error('No keyframe is found.')
+        sys.exit(1)
+    # Frames would be numbered differently from decoders, e.g. if a packet
+    # has a field.
+    frame_num = CountDecodedFrames(movie_input.GetInputArgs(options.movie))
+    if frame_num is None:
+        logging.error('Failed to count frames.')
+        sys.exit(1)
+    if frame_num != len(frames):
+        logging.warning('%d packets for %d frames. The index is not written.',
+                        len(frames), frame_num)
+        return
+    WriteIndex(options.output, frames)
+
+
+if __name__ == '__main__':
+    Main()
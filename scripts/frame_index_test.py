@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import frame_index
+
+FRAME_DURATION = 1001 / 30000.0
+GOP_SIZE = 15
+
+
+def CreatePackets(gop_num, first_pts_time=1.0, open_gop=True):
+    # Returns packets of IBBPBBP... GOPs in the decode order. B frames after
+    # an I frame are displayed before it in open GOPs. Closed GOPs are in
+    # the display order from the I frame.
+    key_index = 2 if open_gop else 0
+    packets = []
+    pos = 188
+    for gop in xrange(gop_num):
+        gop_start = gop * GOP_SIZE
+        decode_order = []
+        for anchor in xrange(2, GOP_SIZE, 3):
+            decode_order.append(anchor)
+            decode_order.extend([anchor - 2, anchor - 1])
+        if not open_gop:
+            decode_order = sorted(decode_order)
+        for display_index in decode_order:
+            packets.append((
+                first_pts_time + (gop_start + display_index) * FRAME_DURATION,
+                pos, display_index == key_index))
+            pos = pos + 188 * 10
+    return packets
+
+
+class FrameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, frame_index.INDEX_FILENAME)
+
+    def tearDown(self):
+        frame_index._key_frames_cache.clear()
+        shutil.rmtree(self.dirname)
+
+    def testNumberFramesOfOpenGop(self):
+        packets = CreatePackets(3)
+        frames = frame_index.NumberFrames(packets)
+        # Two B frames before the first keyframe refer to a missing frame
+        # and are dropped by decoders.
+        self.assertEqual(len(packets) - 2, len(frames))
+        self.assertTrue(frames[0][2])
+        for i in xrange(1, len(frames)):
+            self.assertAlmostEqual(
+                FRAME_DURATION, frames[i][0] - frames[i - 1][0], places=6)
+        self.assertEqual([0, 15, 30], [i for (i, frame) in enumerate(frames)
+                                       if frame[2]])
+
+    def testNumberFramesOfClosedGop(self):
+        packets = CreatePackets(2, open_gop=False)
+        self.assertEqual(sorted(packets), frame_index.NumberFrames(packets))
+
+    def testNumberFramesWithoutKeyFrames(self):
+        self.assertEqual([], frame_index.NumberFrames(
+            [(1.0, 188, False), (1.1, 376, False)]))
+
+    def testFindKeyFrame(self):
+        frame_index.WriteIndex(
+            self.filename, frame_index.NumberFrames(CreatePackets(3)))
+        self.assertEqual(
+            (0, 0.0), frame_index.FindKeyFrame(0, self.filename))
+        self.assertEqual(
+            (0, 0.0), frame_index.FindKeyFrame(14, self.filename))
+        (frame_num, time) = frame_index.FindKeyFrame(20, self.filename)
+        self.assertEqual(15, frame_num)
+        self.assertAlmostEqual(15 * FRAME_DURATION, time, places=5)
+        (frame_num, _) = frame_index.FindKeyFrame(1000, self.filename)
+        self.assertEqual(30, frame_num)
+
+    def testFindKeyFrameWithoutIndex(self):
+        self.assertIsNone(frame_index.FindKeyFrame(10, self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+# Demuxes a cleaned ts from stdin into in.mp4v, in.aac and raw_silence.txt
+# like ts_dumper.pl and, in the same decode, stores features of all fields,
+# sponsor marks and the logo detection result. Used with follow_reader.py to
+# analyze a recording while it is still being written.
+
+import fcntl
+import field_features
+import logging
+import optparse
+import os
+import raw_video
+import scene_change_detector
+import stage_timer
+import subprocess
+import sys
+
+MOVIE_FILENAME = 'in.mp4v'
+AUDIO_FILENAME = 'in.aac'
+RAW_SILENCE_FILENAME = 'raw_silence.txt'
+SILENCE_DETECTOR_FILENAME = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'silence_detector', 'silence_detector')
+FIELD_FEATURES_DIRNAME = 'field_features'
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser(usage='%prog [options] < input.ts')
+    parser.add_option('--aggressive_analysis', dest='aggressive_analysis',
+                      action='store_true', default=False,
+                      help='Passed to silence_detector.')
+    parser.add_option('--logo_info', dest='logo_info', default=None,
+                      help='logo information to detect the logo on the fly.')
+    parser.add_option('--cache_dir', dest='cache_dir', default='',
+                      help=('Directory of the logo result cache shared'
+                            ' across runs. Disabled if empty.'))
+    parser.add_option('--output_dir', dest='output_dir',
+                      default=FIELD_FEATURES_DIRNAME,
+                      help='Directory to store features of fields.')
+    (options, _) = parser.parse_args(args)
+    return options
+
+
+def GetFieldOutput():
+    return [
+        '-filter:v', 'separatefields,scale=width=%d:height=%d' % (
+            scene_change_detector.DUMP_WIDTH,
+            scene_change_detector.DUMP_HEIGHT),
+        '-vsync', 'passthrough',
+        '-an',
+        '-pix_fmt', 'bgr24',
+        '-f', 'rawvideo',
+        'pipe:1']
+
+
+def GetAudioOutput(output_fd):
+    return [
+        '-vn',
+        '-acodec', 'pcm_s24le',
+        '-f', 'wav',
+        'pipe:%d' % output_fd]
+
+
+def OpenSilenceDetector(options):
+    # Returns the process and the write end of its input for ffmpeg.
+    command = [SILENCE_DETECTOR_FILENAME]
+    if options.aggressive_analysis:
+        command.append('--aggressive_analysis')
+    command.append('-')
+    (input_fd, output_fd) = os.pipe()
+    # silence_detector never sees the end of input if it holds |output_fd|.
+    fcntl.fcntl(output_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+    with open(RAW_SILENCE_FILENAME, 'w') as output_file:
+        process = subprocess.Popen(
+            command, stdin=input_fd, stdout=output_file)
+    os.close(input_fd)
+    fcntl.fcntl(output_fd, fcntl.F_SETFD, 0)
+    return (process, output_fd)
+
+
+def Main():
+    options = ParseOptions()
+    for filename in (MOVIE_FILENAME, AUDIO_FILENAME, RAW_SILENCE_FILENAME,
+                     scene_change_detector.LOGO_RESULT_FILENAME):
+        if os.path.exists(filename):
+            logging.error('%s already exists.', filename)
+            sys.exit(1)
+
+    # ffmpeg reads the ts from stdin of this process.
+    command = [
+        'ffmpeg', '-i', 'pipe:0',
+        '-an', '-vcodec', 'copy', '-f', 'mp4', MOVIE_FILENAME,
+        '-vn', '-acodec', 'copy', '-f', 'adts', AUDIO_FILENAME]
+    # Opened before the logo pipe not to inherit it.
+    (silence_process, audio_output_fd) = OpenSilenceDetector(options)
+    command.extend(GetAudioOutput(audio_output_fd))
+    command.extend(GetFieldOutput())
+    command.extend(scene_change_detector.GetSponsorMarkDumpOutput())
+    logo_stream = None
+    if options.logo_info is not None:
+        logo_stream = scene_change_detector.OpenLogoStream(options)
+        command.extend(logo_stream[0])
+
+    with stage_timer.Span('histogram'):
+        (process, log_file) = raw_video.OpenRawVideo(command)
+        os.close(audio_output_fd)
+        logo_errors = []
+        logo_thread = None
+        if logo_stream is not None:
+            (logo_thread, logo_errors) = (
+                scene_change_detector.StartLogoDetection(
+                    options, logo_stream[1], logo_stream[2]))
+        writer = field_features.FieldFeatureWriter(options.output_dir)
+        for field in raw_video.ReadFrames(
+                process.stdout, scene_change_detector.DUMP_WIDTH,
+                scene_change_detector.DUMP_HEIGHT):
+            writer.Append(*scene_change_detector.CalcFieldFeatures(field))
+        writer.Close()
+
+        (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+        if logo_thread is not None:
+            logo_thread.join()
+        silence_returncode = silence_process.wait()
+    if returncode != 0 or logo_errors or silence_returncode != 0:
+        logging.error(output)
+        logging.error('Failed to dump the live stream.')
+        if os.path.exists(scene_change_detector.LOGO_RESULT_FILENAME):
+            os.remove(scene_change_detector.LOGO_RESULT_FILENAME)
+        sys.exit(returncode or -1)
+
+
+if __name__ == '__main__':
+    Main()
@@ -1,20 +1,84 @@
 #!/usr/bin/python
 
+import collections
 import cv2
+import functools
+import itertools
 import logging
 import os
 import re
 import sys
 import numpy
 import optparse
+import raw_video
+import result_cache
+import stage_timer
 
+DETECTION_BATCH_SIZE = 256
 
-def GetLogoFileName(options):
+
+def GetLogoFileName(logo_name):
     return os.path.join(
         os.path.abspath(os.path.dirname(__file__)),
         '..',
         'logo',
-        '%s.png' % options.logo)
+        '%s.png' % logo_name)
+
+
+def LoadLogoImage(logo_name):
+    return cv2.cvtColor(cv2.imread(GetLogoFileName(logo_name)),
+                        cv2.COLOR_BGR2GRAY)
+
+
+def OpenLogoResultCache(cache_dirname, cache_size, logo_image):
+    # Results depend on the reference logo as well.
+    return result_cache.OpenResultCache(
+        cache_dirname,
+        'logo:%s' % result_cache.CalcContentDigest(logo_image),
+        cache_size)
+
+
+def ParseLogoInformation(logo_name):
+    logo_dir = os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), '../logo')
+    required_keys = set(('offset_x', 'offset_y', 'width', 'height'))
+    info = {}
+    input_filename = '%s/%s.txt' % (logo_dir, logo_name)
+    with open(input_filename) as input_file:
+        for line in input_file:
+            (key, value) = line.split(':')
+            key.strip()
+            value.strip()
+            value = int(value)
+            assert key in required_keys, (
+                'Invalid key "%s" in %s' % (key, input_filename))
+            assert value >= 0, (
+                'Value for key "%s" in %s should be positive' % (
+                    key, input_filename))
+            assert value % 4 == 0, '%s should be in multiples of 4.' % key
+            info[key] = int(value)
+    assert len(required_keys) == len(info), (
+        '%s should have all of %s' % (
+            input_filename, [key for key in required_keys]))
+    return info
+
+
+def GetLogoCropFilter(logo_info, sampling_rate, select=None):
+    # |select| is an expression of sample indices to keep.
+    offset_x = logo_info['offset_x']
+    offset_y = logo_info['offset_y']
+    width = logo_info['width']
+    height = logo_info['height']
+
+    extra_offset_x = 4 if offset_x >= 4 else offset_x
+    extra_offset_y = 4 if offset_y >= 4 else offset_y
+    select_filter = ",select='%s'" % select if select is not None else ''
+    return ('fps=fps=%g:round=down%s'
+            ',crop=%d:%d:%d:%d,yadif,crop=%d:%d:%d:%d' % (
+                sampling_rate, select_filter,
+                width + 8, height + 8,
+                offset_x - extra_offset_x, offset_y - extra_offset_y,
+                width, height, extra_offset_x, extra_offset_y))
 
 
 def ParseOptions(args=None):
@@ -22,7 +86,46 @@ def ParseOptions(args=None):
     parser.add_option('--logo', dest='logo', default=None,
                       help=('The reference logo name in logo dir'
                             'w/o filename extension.'))
+    parser.add_option('--movie', dest='movie', default=None,
+                      help=('Movie to detect the logo on. Cropped frames are'
+                            ' read from an ffmpeg pipe instead of logo_dump.'))
+    parser.add_option('--input', dest='input', default=None,
+                      help=('"-" to read cropped frames as raw bgr24 video'
+                            ' from stdin instead of logo_dump.'))
+    parser.add_option('--sampling_rate', dest='sampling_rate', type='float',
+                      default=1.0,
+                      help=('Frames per second to check on --movie. Only 1'
+                            ' is supported since logo.txt has a line per'
+                            ' second.'))
+    parser.add_option('--bisect_step', dest='bisect_step', type='int',
+                      default=1,
+                      help=('Check every this number of samples on --movie'
+                            ' and detect samples between them by seeks only'
+                            ' where neighbors disagree. The logo appearing'
+                            ' and disappearing again between two checks is'
+                            ' missed.'))
+    parser.add_option('--cache_dir', dest='cache_dir', default='',
+                      help=('Directory of the result cache shared across'
+                            ' runs. Disabled if empty.'))
+    parser.add_option('--cache_size', dest='cache_size', type='int',
+                      default=result_cache.DEFAULT_MAX_ENTRIES,
+                      help='The max number of entries in the result cache.')
     (options, _) = parser.parse_args(args)
+
+    if options.movie is not None and options.input is not None:
+        raise ValueError('Cannot use --movie and --input at the same time.')
+    if options.input not in (None, '-'):
+        raise ValueError('Only "-" is supported for --input.')
+    if options.sampling_rate != 1:
+        # scene_filter.pl keys results by seconds, so other rates would
+        # write a second twice or skip seconds.
+        raise ValueError('Only 1 is supported for --sampling_rate.')
+    if options.bisect_step <= 0:
+        raise ValueError('Bisect step should be positive.')
+    if options.bisect_step > 1 and options.movie is None:
+        raise ValueError('--bisect_step needs --movie to seek.')
+    if options.cache_size <= 0:
+        raise ValueError('Cache size should be positive.')
     return options
 
 
@@ -68,119 +171,474 @@ def LoadLogoRangeData(logo_image):
     return filtered_ranges
 
 
-def RowDetect(logo_image_row, logo_range_row, target_row):
-    discarded = 0
-    detected = 0
-    for start, end, color in logo_range_row:
-        left = int(target_row[start - 2])
-        right = int(target_row[end + 1])
-        base_color = (left + right) / 2
-
-        too_dark_color = False
-        base_color_with_margin = base_color - 8
-        dark_threshold = base_color * 0.7 - 8
-        for x in xrange(start, end):
-            # Please pay attention for performance.
-            if target_row[x] < max(logo_image_row[x] + dark_threshold,
-                                   base_color_with_margin):
-                too_dark_color = True
-                break
-        if too_dark_color:
-            continue
+def CreateRangeIndex(logo_image):
+    range_data = LoadLogoRangeData(logo_image)
+    ys = []
+    starts = []
+    ends = []
+    for (y, row) in enumerate(range_data):
+        for (start, end, _) in row:
+            ys.append(y)
+            starts.append(start)
+            ends.append(end)
+    ys = numpy.array(ys, dtype=numpy.intp)
+    starts = numpy.array(starts, dtype=numpy.intp)
+    ends = numpy.array(ends, dtype=numpy.intp)
+    lengths = ends - starts
+
+    # Pixels of all ranges are laid out range by range, so that per-range
+    # values can be calculated by reduceat with |offsets|.
+    offsets = numpy.zeros(len(lengths), dtype=numpy.intp)
+    offsets[1:] = numpy.cumsum(lengths)[:-1]
+    range_ids = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    pixel_ys = ys[range_ids]
+    pixel_xs = (numpy.arange(lengths.sum(), dtype=numpy.intp)
+                - offsets[range_ids] + starts[range_ids])
+    return {
+        'height': len(range_data),
+        'ys': ys,
+        'lefts': starts - 2,
+        'rights': ends + 1,
+        'lengths': lengths,
+        'offsets': offsets,
+        'range_ids': range_ids,
+        'pixel_ys': pixel_ys,
+        'pixel_xs': pixel_xs,
+        'logo_pixels': logo_image[pixel_ys, pixel_xs].astype(numpy.float64),
+    }
 
-        if abs(left - right) > 8 or base_color > 192:
-            discarded = discarded + 1
-            continue
 
-        target_average = sum(target_row[start:end]) / (end - start)
-        if target_average > base_color + 8:
-            detected = detected + 1
-    return (detected, len(logo_range_row) - discarded)
+def CreateLogoIndex(logo_image):
+    return (CreateRangeIndex(logo_image), CreateRangeIndex(logo_image.T))
 
 
-def HorizontalDetect(logo_image, target_image):
-    logo_range_data = LoadLogoRangeData(logo_image)
-    assert len(logo_range_data) == len(target_image), (
+def HorizontalDetect(range_index, target_images):
+    assert range_index['height'] == target_images.shape[1], (
            'Inconsistent image size. reference logo: %dpx, target: %dpx' % (
-               len(logo_range_data), len(target_image)))
+               range_index['height'], target_images.shape[1]))
+
+    image_num = len(target_images)
+    range_num = len(range_index['lengths'])
+    if range_num == 0:
+        zeros = numpy.zeros(image_num, dtype=numpy.int64)
+        return (zeros, zeros, 0)
+
+    ys = range_index['ys']
+    left = target_images[:, ys, range_index['lefts']].astype(numpy.int64)
+    right = target_images[:, ys, range_index['rights']].astype(numpy.int64)
+    base_color = (left + right) // 2
+
+    range_ids = range_index['range_ids']
+    offsets = range_index['offsets']
+    targets = target_images[:, range_index['pixel_ys'], range_index['pixel_xs']]
+    base_color_with_margin = base_color - 8
+    dark_threshold = base_color * 0.7 - 8
+    thresholds = numpy.maximum(
+        range_index['logo_pixels'] + dark_threshold[:, range_ids],
+        base_color_with_margin[:, range_ids])
+    too_dark_color = numpy.logical_or.reduceat(
+        targets < thresholds, offsets, axis=1)
+
+    discarded = ~too_dark_color & (
+        (numpy.abs(left - right) > 8) | (base_color > 192))
 
-    candidate_sum = 0
-    detected_sum = 0
-    range_sum = 0
-    for y in xrange(len(logo_range_data)):
-        (detected_num, candidate_num) = RowDetect(
-            logo_image[y], logo_range_data[y], target_image[y])
-        candidate_sum = candidate_sum + candidate_num
-        detected_sum = detected_sum + detected_num
-        range_sum = range_sum + len(logo_range_data[y])
-    return (detected_sum, candidate_sum, range_sum)
+    target_average = numpy.add.reduceat(
+        targets.astype(numpy.int64), offsets, axis=1) // range_index['lengths']
+    detected = (~too_dark_color & ~discarded &
+                (target_average > base_color + 8))
+    return (detected.sum(axis=1), range_num - discarded.sum(axis=1),
+            range_num)
 
 
-def Detect(logo_image, target_image, tag=''):
+def DetectImages(logo_index, target_images, tags=None, cache=None):
+    if cache is not None:
+        return DetectCachedImages(logo_index, target_images, tags, cache)
+
     detected_num = 0
     candidate_num = 0
     total_num = 0
     for i in xrange(2):
         if i == 0:
-            (a, b, c) = HorizontalDetect(logo_image, target_image)
+            (a, b, c) = HorizontalDetect(logo_index[0], target_images)
         else:
-            (a, b, c) = HorizontalDetect(logo_image.T, target_image.T)
+            (a, b, c) = HorizontalDetect(
+                logo_index[1], target_images.transpose(0, 2, 1))
         detected_num = detected_num + a
         candidate_num = candidate_num + b
         total_num = total_num + c
 
     # Eligible if some of target pixels are NOT saturated.
-    is_eligible = (candidate_num > 0 and candidate_num > total_num / 10.0)
-    if is_eligible:
-        detected_ratio = float(detected_num) / candidate_num
-    else:
-        detected_ratio = 0.0
+    is_eligible = (candidate_num > 0) & (candidate_num > total_num / 10.0)
+    detected_ratio = numpy.where(
+        is_eligible,
+        detected_num / numpy.maximum(candidate_num, 1).astype(numpy.float64),
+        0.0)
 
     debug_print = False
     if debug_print:
-        if not is_eligible:
-            result_mark = '-'
-        elif detected_ratio > 0.3:
-            result_mark = 'o'
+        for i in xrange(len(target_images)):
+            if not is_eligible[i]:
+                result_mark = '-'
+            elif detected_ratio[i] > 0.3:
+                result_mark = 'o'
+            else:
+                result_mark = ' '
+            print '%s: %c ratio:%.2f, count:%d' % (
+                tags[i] if tags else i, result_mark, detected_ratio[i],
+                candidate_num[i])
+
+    return (detected_ratio > 0.3).tolist()
+
+
+def DetectCachedImages(logo_index, target_images, tags, cache):
+    # Still scenes give many identical frames. Scan only new ones. Keys are
+    # exact digests since a perceptual hash mostly encodes the background
+    # and may not tell a faint logo from none.
+    keys = [result_cache.CalcContentDigest(image) for image in target_images]
+    results = cache.GetMany(keys)
+    missed = [i for (i, result) in enumerate(results) if result is None]
+    if missed:
+        detected = DetectImages(
+            logo_index, target_images[missed],
+            tags=[tags[i] for i in missed] if tags else missed)
+        for (i, result) in zip(missed, detected):
+            results[i] = result
+        cache.PutMany([(keys[i], results[i]) for i in missed])
+    return results
+
+
+def Detect(logo_index, target_image, tag='', cache=None):
+    return DetectImages(
+        logo_index, target_image[numpy.newaxis], tags=[tag], cache=cache)[0]
+
+
+def LoadDumpedImageBatches(input_dirname):
+    image_path_regex = re.compile(r'\.(png|jpg)$')
+    input_filenames = [f for f in sorted(os.listdir(input_dirname))
+                       if image_path_regex.search(f)]
+    for i in xrange(0, len(input_filenames), DETECTION_BATCH_SIZE):
+        tags = input_filenames[i:i + DETECTION_BATCH_SIZE]
+        images = numpy.array([
+            cv2.cvtColor(cv2.imread('%s/%s' % (input_dirname, tag)),
+                         cv2.COLOR_BGR2GRAY)
+            for tag in tags])
+        yield (tags, images)
+
+
+def ReadImageBatches(input_file, width, height):
+    # Frames are bgr24 to get the same gray values as dumped images.
+    batch = []
+    for frame in raw_video.ReadFrames(input_file, width, height):
+        batch.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        if len(batch) == DETECTION_BATCH_SIZE:
+            yield (None, numpy.array(batch))
+            batch = []
+    if batch:
+        yield (None, numpy.array(batch))
+
+
+def GetOutputIndex(sample_index, sampling_rate):
+    # 1-origin to keep a consistency with the output of ffmpeg.
+    # scene_filter.pl reads the index as seconds.
+    return int(sample_index / sampling_rate) + 1
+
+
+def WriteResults(logo_index, batches, sampling_rate, output_file,
+                 cache=None):
+    sample_index = 0
+    for (tags, images) in batches:
+        for result in DetectImages(logo_index, images, tags=tags,
+                                   cache=cache):
+            output_file.write('%06d %s\n' % (
+                GetOutputIndex(sample_index, sampling_rate), result))
+            sample_index = sample_index + 1
+        output_file.flush()
+
+
+def GetMovieInputArgs(movie_filename, seek_time=None):
+    args = ['-i', movie_filename]
+    if seek_time is not None:
+        args = ['-ss', '%.6f' % seek_time] + args
+    return args
+
+
+def OpenLogoImages(get_input_args, logo_info, sampling_rate, sample_index,
+                   count=None):
+    # Opens ffmpeg which outputs bgr24 crops of |count| samples from
+    # |sample_index| at |sampling_rate|, or until the end without |count|.
+    # |get_input_args| returns ffmpeg options to read the movie from a time,
+    # or from the start without it.
+    command = ['ffmpeg'] + get_input_args(
+        sample_index / float(sampling_rate) if sample_index else None)
+    command.extend([
+        '-filter:v', GetLogoCropFilter(logo_info, sampling_rate),
+        '-an'])
+    if count is not None:
+        command.extend(['-frames:v', '%d' % count])
+    command.extend([
+        '-pix_fmt', 'bgr24',
+        '-f', 'rawvideo',
+        'pipe:1'])
+    return raw_video.OpenRawVideo(command)
+
+
+def CloseLogoImages(process, log_file):
+    (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+    if returncode != 0:
+        logging.error(output)
+        raise IOError('Failed to read samples.')
+
+
+def SeekLogoImages(get_input_args, logo_info, sampling_rate, sample_index,
+                   count=None):
+    # Returns gray crops of samples as OpenLogoImages.
+    (process, log_file) = OpenLogoImages(
+        get_input_args, logo_info, sampling_rate, sample_index, count)
+    try:
+        images = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                  for frame in raw_video.ReadFrames(
+                      process.stdout, logo_info['width'], logo_info['height'])]
+    finally:
+        CloseLogoImages(process, log_file)
+    return images
+
+
+def DetectSeekedRange(logo_index, get_input_args, logo_info, sampling_rate,
+                      cache, sparse_results, first_index, last_index=None):
+    # Returns results of samples from |first_index| to |last_index|, or
+    # until the end without it, by a seek. The fps filter and yadif restart
+    # at the seek point, so the seek starts a sample earlier to give yadif
+    # its previous frame, and the results are used only if sparse samples in
+    # the range agree with |sparse_results| by their indices. Returns None
+    # otherwise.
+    seek_index = max(first_index - 1, 0)
+    count = None if last_index is None else last_index - seek_index + 1
+    images = SeekLogoImages(
+        get_input_args, logo_info, sampling_rate, seek_index, count)
+    if len(images) <= first_index - seek_index:
+        return None
+    results = DetectImages(logo_index, numpy.array(images), cache=cache)
+    results = results[first_index - seek_index:]
+    if count is not None and len(results) != last_index - first_index + 1:
+        return None
+    for (i, result) in enumerate(results):
+        sample_index = first_index + i
+        if (sample_index in sparse_results and
+                result != sparse_results[sample_index]):
+            return None
+    return results
+
+
+def GetDenseSampleRanges(silence_ranges, bisect_step):
+    # Returns sorted disjoint ranges of sample indices within |bisect_step|
+    # samples of |silence_ranges| of sample indices. The logo appears and
+    # disappears around CMs, which are bounded by silence, so samples there
+    # are all detected and short runs of the logo can't hide between sparse
+    # samples.
+    ranges = []
+    for (start, end) in sorted(silence_ranges):
+        start = max(start - bisect_step, 0)
+        end = end + bisect_step
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], end)
         else:
-            result_mark = ' '
-        print '%s: %c ratio:%.2f, count:%d' % (
-            tag, result_mark, detected_ratio, candidate_num)
+            ranges.append([start, end])
+    return ranges
+
 
-    return detected_ratio > 0.3
+def GetSparseSampleIndices(bisect_step, dense_ranges=()):
+    # Yields indices of samples every |bisect_step| samples and in sorted
+    # disjoint |dense_ranges|, in the order of the sparse stream.
+    dense_ranges = collections.deque(dense_ranges)
+    for sample_index in itertools.count():
+        while dense_ranges and dense_ranges[0][1] < sample_index:
+            dense_ranges.popleft()
+        if (sample_index % bisect_step == 0 or
+                (dense_ranges and dense_ranges[0][0] <= sample_index)):
+            yield sample_index
+
+
+def FillResults(sparse_samples, detect_range):
+    # Fills samples between sparse ones, which are (sample_index, result)
+    # sorted by sample_index from 0. The logo appears and disappears only
+    # around CMs, so samples between agreeing neighbors take their result,
+    # and those between disagreeing ones are detected by
+    # |detect_range|(first_index, last_index) as DetectSeekedRange. A
+    # transition and its reverse between two sparse samples are missed.
+    # Returns results of all samples and the number of detected ones, or
+    # None if |detect_range| fails.
+    results = []
+    detected_num = len(sparse_samples)
+    for (i, (first_index, result)) in enumerate(sparse_samples):
+        if i + 1 == len(sparse_samples):
+            # Samples after the last sparse one until the end of the movie.
+            range_results = detect_range(first_index, None)
+        else:
+            (next_index, next_result) = sparse_samples[i + 1]
+            if result == next_result or next_index == first_index + 1:
+                results.extend([result] * (next_index - first_index))
+                continue
+            range_results = detect_range(first_index, next_index)
+            if range_results is not None:
+                # The last one is the next sparse sample.
+                range_results = range_results[:-1]
+        if range_results is None:
+            return None
+        results.extend(range_results)
+        detected_num = detected_num + len(range_results) - 1
+    return (results, detected_num)
+
+
+def WriteDenseResults(logo_index, get_input_args, logo_info, sampling_rate,
+                      output_file, cache=None):
+    # Detects all samples by a sequential decode as WriteResults.
+    (process, log_file) = OpenLogoImages(
+        get_input_args, logo_info, sampling_rate, 0)
+    try:
+        WriteResults(logo_index, ReadImageBatches(
+            process.stdout, logo_info['width'], logo_info['height']),
+            sampling_rate, output_file, cache=cache)
+    finally:
+        CloseLogoImages(process, log_file)
+
+
+def WriteBisectedResults(logo_index, batches, logo_info, sampling_rate,
+                         bisect_step, get_input_args, output_file,
+                         cache=None, dense_ranges=()):
+    # |batches| have samples of GetSparseSampleIndices at |sampling_rate|.
+    # The output has all samples as WriteResults. All samples are decoded
+    # again if seeked samples disagree with sequential ones.
+    sample_indices = GetSparseSampleIndices(bisect_step, dense_ranges)
+    sparse_samples = []
+    for (tags, images) in batches:
+        for result in DetectImages(logo_index, images, tags=tags,
+                                   cache=cache):
+            sparse_samples.append((next(sample_indices), result))
+    if not sparse_samples:
+        return
+    filled = FillResults(
+        sparse_samples,
+        functools.partial(
+            DetectSeekedRange, logo_index, get_input_args, logo_info,
+            sampling_rate, cache, dict(sparse_samples)))
+    if filled is None:
+        logging.warning('Seeked samples disagree with sequential ones.'
+                        ' Detecting all samples.')
+        WriteDenseResults(logo_index, get_input_args, logo_info,
+                          sampling_rate, output_file, cache=cache)
+        return
+    (results, detected_num) = filled
+    logging.info('Detected the logo on %d of %d samples.',
+                 detected_num, len(results))
+    for (sample_index, result) in enumerate(results):
+        output_file.write('%06d %s\n' % (
+            GetOutputIndex(sample_index, sampling_rate), result))
+    output_file.flush()
+
+
+def DetectStream(logo_name, input_file, output_file, sampling_rate=1,
+                 cache_dirname='', cache_size=result_cache.DEFAULT_MAX_ENTRIES,
+                 bisect_step=1, dense_ranges=(), get_input_args=None):
+    # Detects the logo on cropped bgr24 frames from |input_file|. With
+    # |bisect_step| > 1, the frames are samples of GetSparseSampleIndices at
+    # |sampling_rate| and others are seeked by |get_input_args| if needed.
+    # |get_input_args| also reads all samples if seeks fail.
+    logo_image = LoadLogoImage(logo_name)
+    logo_info = ParseLogoInformation(logo_name)
+    cache = OpenLogoResultCache(cache_dirname, cache_size, logo_image)
+    try:
+        batches = ReadImageBatches(
+            input_file, logo_info['width'], logo_info['height'])
+        if bisect_step > 1:
+            WriteBisectedResults(
+                CreateLogoIndex(logo_image), batches, logo_info,
+                sampling_rate, bisect_step, get_input_args, output_file,
+                cache=cache, dense_ranges=dense_ranges)
+        else:
+            WriteResults(CreateLogoIndex(logo_image), batches, sampling_rate,
+                         output_file, cache=cache)
+    finally:
+        if cache is not None:
+            cache.Close()
 
 
 def Main():
     options = ParseOptions()
-    logo_filename = GetLogoFileName(options)
+    logo_filename = GetLogoFileName(options.logo)
     input_dirname = 'logo_dump'
+    output_filename = 'logo.txt'
 
     if not os.path.isfile(logo_filename):
         logging.error('Logo file is not found or not a file.')
         sys.exit(-1)
-    if not os.path.isdir(input_dirname):
+    if options.movie is not None:
+        if not os.path.isfile(options.movie):
+            logging.error('Input movie is not found or not a file.')
+            sys.exit(-1)
+    elif options.input is None and not os.path.isdir(input_dirname):
         logging.error('Input video directory is not found or not a directory.')
         sys.exit(-1)
-    if os.path.exists('logo.txt'):
-        logging.error('logo.txt already exists.')
+    if os.path.exists(output_filename):
+        logging.error('%s already exists.', output_filename)
         sys.exit(-1)
 
-    logo_image = cv2.cvtColor(cv2.imread(logo_filename), cv2.COLOR_BGR2GRAY)
+    logo_image = LoadLogoImage(options.logo)
+    logo_index = CreateLogoIndex(logo_image)
+    cache = OpenLogoResultCache(
+        options.cache_dir, options.cache_size, logo_image)
+
+    process = None
+    sampling_rate = 1
+    if options.movie is not None or options.input is not None:
+        logo_info = ParseLogoInformation(options.logo)
+        sampling_rate = options.sampling_rate
+        if options.movie is not None:
+            # Samples between every |bisect_step| ones are seeked later.
+            command = [
+                'ffmpeg', '-i', options.movie,
+                '-filter:v', GetLogoCropFilter(
+                    logo_info, sampling_rate / options.bisect_step),
+                '-an',
+                '-pix_fmt', 'bgr24',
+                '-f', 'rawvideo',
+                'pipe:1']
+            (process, log_file) = raw_video.OpenRawVideo(command)
+            input_file = process.stdout
+        else:
+            input_file = sys.stdin
+        batches = ReadImageBatches(
+            input_file, logo_info['width'], logo_info['height'])
+    else:
+        batches = LoadDumpedImageBatches(input_dirname)
+
+    try:
+        with open(output_filename, 'w') as output_file:
+            with stage_timer.Span('detect'):
+                if options.bisect_step > 1:
+                    WriteBisectedResults(
+                        logo_index, batches, logo_info, sampling_rate,
+                        options.bisect_step,
+                        functools.partial(GetMovieInputArgs, options.movie),
+                        output_file, cache=cache)
+                else:
+                    WriteResults(logo_index, batches, sampling_rate,
+                                 output_file, cache=cache)
+    except IOError:
+        logging.error('Failed to detect the logo by seeks.')
+        os.remove(output_filename)
+        sys.exit(-1)
+    finally:
+        if cache is not None:
+            cache.Close()
+
+    if process is not None:
+        (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+        if returncode != 0:
+            logging.error(output)
+            logging.error('Failed to read the movie.')
+            os.remove(output_filename)
+            sys.exit(returncode)
 
-    image_path_regex = re.compile(r'\.(png|jpg)$')
-    results = []
-    for input_filename in sorted(os.listdir(input_dirname)):
-        if not image_path_regex.search(input_filename):
-            continue
-        input_path = '%s/%s' % (input_dirname, input_filename)
-        im = cv2.cvtColor(cv2.imread(input_path), cv2.COLOR_BGR2GRAY)
-        results.append(Detect(logo_image, im, tag=input_filename))
-
-    with open('logo.txt', 'w') as output_file:
-        # 1-origin to keep a consistency with the output of ffmpeg.
-        for i, result in enumerate(results):
-            output_file.write('%06d %s\n' % (i + 1, result))
-        
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
@@ -6,7 +6,6 @@ use utf8;
 use POSIX qw/:math_h/;
 
 die "scene.txt doesn't exist." unless -f 'scene.txt';
-die "dump/ directory doesn't exist." unless -d 'dump';
 die "index.html already exists." if -e 'index.html';
 
 open my $scene_fh, '<', 'scene.txt' or die;
@@ -43,15 +42,19 @@ for my $i (0..$#all_scenes) {
         frameDiffStr($changed, $start), $changed, frameDiffStr($end, $changed),
         frameToTime($changed));
 
-    push @output, '<div>';
-    my $template =
-        '<img width="224px" height="126px" class="%s" src="dump/%03d/%d.jpg">';
-    push @output, 
-        sprintf($template, $previous_type, $i, 1) .
-        sprintf($template, $previous_type, $i, 2) .
-        sprintf($template, $current_type, $i, 3) .
-        sprintf($template, $current_type, $i, 4);
-    push @output, '</div>';
+    # Images are dumped only with --debug_dump on the stream mode.
+    if (-d sprintf('dump/%03d', $i)) {
+        push @output, '<div>';
+        my $template =
+            '<img width="224px" height="126px" class="%s"' .
+            ' src="dump/%03d/%d.jpg">';
+        push @output,
+            sprintf($template, $previous_type, $i, 1) .
+            sprintf($template, $previous_type, $i, 2) .
+            sprintf($template, $current_type, $i, 3) .
+            sprintf($template, $current_type, $i, 4);
+        push @output, '</div>';
+    }
     $previous_type = $current_type;
 }
 push @output, '</body></html>';
@@ -0,0 +1,50 @@
+import os
+
+# ts_dumper.pl --direct writes this instead of copying the video into
+# in.mp4v. The original file is read in place after the bytes which
+# ts_cleaner drops from its head.
+INDEX_FILENAME = 'in.index'
+
+
+def LoadIndex():
+    # Returns None unless the index exists.
+    if not os.path.isfile(INDEX_FILENAME):
+        return None
+    index = {}
+    with open(INDEX_FILENAME) as index_file:
+        for line in index_file:
+            (key, value) = line.rstrip('\n').split('\t', 1)
+            index[key] = value
+    return index
+
+
+def Exists(movie_filename):
+    return os.path.isfile(INDEX_FILENAME) or os.path.isfile(movie_filename)
+
+
+def GetVideoStart():
+    # Returns the time of the first video frame from the start of the input
+    # in seconds, or None for in.mp4v.
+    index = LoadIndex()
+    if index is None:
+        return None
+    return float(index['video_start'])
+
+
+def GetInputArgs(movie_filename, seek_time=None):
+    # Returns ffmpeg options to read the movie from |seek_time| seconds after
+    # the first video frame.
+    index = LoadIndex()
+    args = []
+    if index is None:
+        if seek_time is not None:
+            args.extend(['-ss', '%.6f' % seek_time])
+        return args + ['-i', movie_filename]
+
+    if seek_time is not None:
+        # The original input starts earlier than its video.
+        args.extend([
+            '-ss', '%.6f' % (seek_time + float(index['video_start']))])
+    return args + [
+        '-skip_initial_bytes', index['skip_initial_bytes'],
+        '-i', index['input']]
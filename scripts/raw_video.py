@@ -0,0 +1,40 @@
+import numpy
+import subprocess
+import tempfile
+
+
+def OpenRawVideo(command):
+    # ffmpeg is so verbose that a PIPE for stderr would fill and block it
+    # while stdout is being read. Keep the log in a file for error reports.
+    log_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=log_file)
+    return (process, log_file)
+
+
+def CloseRawVideo(process, log_file):
+    process.stdout.close()
+    process.wait()
+    log_file.seek(0)
+    output = log_file.read()
+    log_file.close()
+    return (process.returncode, output)
+
+
+def ReadFrame(input_file, width, height, channels=3):
+    size = width * height * channels
+    data = input_file.read(size)
+    if len(data) < size:
+        return None
+    frame = numpy.frombuffer(data, dtype=numpy.uint8)
+    if channels == 1:
+        return frame.reshape((height, width))
+    return frame.reshape((height, width, channels))
+
+
+def ReadFrames(input_file, width, height, channels=3):
+    while True:
+        frame = ReadFrame(input_file, width, height, channels)
+        if frame is None:
+            return
+        yield frame
@@ -0,0 +1,131 @@
+import binascii
+import cv2
+import hashlib
+import logging
+import numpy
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILENAME = 'result_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 200000
+DEFAULT_HASH_SIZE = 16
+
+
+def CalcPerceptualHash(image, hash_size=DEFAULT_HASH_SIZE):
+    # Difference hash. Each bit tells whether a cell of the shrunk image is
+    # brighter than its right neighbor, so that re-encoded or slightly noisy
+    # copies of the same picture share the hash.
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size),
+                       interpolation=cv2.INTER_AREA).astype(numpy.int16)
+    bits = small[:, 1:] > small[:, :-1]
+    # The image size is a part of the key to avoid mixing up inputs of
+    # different crops.
+    return '%dx%d:%s' % (image.shape[1], image.shape[0],
+                         binascii.hexlify(numpy.packbits(bits).tostring()))
+
+
+def CalcContentDigest(image):
+    return hashlib.sha1(numpy.ascontiguousarray(image).tostring()).hexdigest()
+
+
+class ResultCache(object):
+    # Persistent map from image keys to boolean results. Keys are perceptual
+    # hashes for sponsor OCR and content digests for the logo.
+    # Least recently used entries are evicted when the number of entries
+    # exceeds |max_entries|. Thread-safe.
+
+    def __init__(self, filename, namespace, max_entries=DEFAULT_MAX_ENTRIES):
+        self._namespace = namespace
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Other processes may use the same cache at the same time.
+        self._connection = sqlite3.connect(
+            filename, timeout=60, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' namespace TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' value INTEGER NOT NULL,'
+                ' last_used REAL NOT NULL,'
+                ' PRIMARY KEY (namespace, key))')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_last_used'
+                ' ON results (last_used)')
+
+    def GetMany(self, keys):
+        # Returns a list with None for missing keys.
+        with self._lock:
+            now = time.time()
+            results = []
+            with self._connection:
+                for key in keys:
+                    row = self._connection.execute(
+                        'SELECT value FROM results'
+                        ' WHERE namespace = ? AND key = ?',
+                        (self._namespace, key)).fetchone()
+                    if row is None:
+                        self.misses = self.misses + 1
+                        results.append(None)
+                        continue
+                    self.hits = self.hits + 1
+                    self._connection.execute(
+                        'UPDATE results SET last_used = ?'
+                        ' WHERE namespace = ? AND key = ?',
+                        (now, self._namespace, key))
+                    results.append(bool(row[0]))
+            return results
+
+    def Get(self, key):
+        return self.GetMany([key])[0]
+
+    def PutMany(self, items):
+        if not items:
+            return
+        with self._lock:
+            now = time.time()
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO results'
+                    ' (namespace, key, value, last_used) VALUES (?, ?, ?, ?)',
+                    [(self._namespace, key, int(bool(value)), now)
+                     for (key, value) in items])
+                self._Evict()
+
+    def Put(self, key, value):
+        self.PutMany([(key, value)])
+
+    def _Evict(self):
+        (entry_num,) = self._connection.execute(
+            'SELECT COUNT(*) FROM results').fetchone()
+        if entry_num <= self._max_entries:
+            return
+        self._connection.execute(
+            'DELETE FROM results WHERE rowid IN ('
+            ' SELECT rowid FROM results ORDER BY last_used LIMIT ?)',
+            (entry_num - self._max_entries,))
+
+    def Close(self):
+        with self._lock:
+            self._connection.close()
+        logging.info('Result cache [%s]: %d hits, %d misses.',
+                     self._namespace, self.hits, self.misses)
+
+
+def OpenResultCache(cache_dirname, namespace,
+                    max_entries=DEFAULT_MAX_ENTRIES):
+    # Returns None if the cache is disabled.
+    if not cache_dirname:
+        return None
+    if not os.path.isdir(cache_dirname):
+        os.makedirs(cache_dirname)
+    return ResultCache(os.path.join(cache_dirname, CACHE_FILENAME),
+                       namespace, max_entries)
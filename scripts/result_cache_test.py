@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import numpy
+import shutil
+import tempfile
+import unittest
+
+import result_cache
+
+
+class FakeTime(object):
+    # Advances a second per call so that entries don't share last_used.
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        self.now = self.now + 1
+        return self.now
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.original_time = result_cache.time
+        result_cache.time = FakeTime()
+
+    def tearDown(self):
+        result_cache.time = self.original_time
+        shutil.rmtree(self.dirname)
+
+    def OpenCache(self, namespace='test', max_entries=3):
+        return result_cache.OpenResultCache(
+            self.dirname, namespace, max_entries)
+
+    def testDisabled(self):
+        self.assertIsNone(result_cache.OpenResultCache('', 'test'))
+
+    def testEvictsLeastRecentlyUsed(self):
+        cache = self.OpenCache()
+        cache.PutMany([('a', True), ('b', False), ('c', True)])
+        # 'a' is used after 'b' and 'c'.
+        self.assertEqual([True], cache.GetMany(['a']))
+        cache.Put('d', False)
+        self.assertEqual([True, None, True, False],
+                         cache.GetMany(['a', 'b', 'c', 'd']))
+        self.assertEqual((4, 1), (cache.hits, cache.misses))
+        cache.Close()
+
+    def testPersistsAcrossProcesses(self):
+        cache = self.OpenCache()
+        cache.Put('a', True)
+        cache.Close()
+        cache = self.OpenCache()
+        self.assertTrue(cache.Get('a'))
+        cache.Close()
+        cache = self.OpenCache(namespace='other')
+        self.assertIsNone(cache.Get('a'))
+        cache.Close()
+
+    def testCalcPerceptualHash(self):
+        image = numpy.random.RandomState(0).randint(
+            0, 256, size=(90, 160)).astype(numpy.uint8)
+        noisy_image = numpy.clip(
+            image.astype(numpy.int16) + 1, 0, 255).astype(numpy.uint8)
+        self.assertEqual(result_cache.CalcPerceptualHash(image),
+                         result_cache.CalcPerceptualHash(noisy_image))
+        self.assertNotEqual(result_cache.CalcPerceptualHash(image),
+                            result_cache.CalcPerceptualHash(image[:, ::-1]))
+        # Crops of different sizes don't share keys.
+        self.assertNotEqual(result_cache.CalcPerceptualHash(image),
+                            result_cache.CalcPerceptualHash(image[:, :150]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,7 @@ use constant {
         'scene_offset.txt',
         'silence.txt',
         'sponsor.txt',
+        'timings.json',
     ],
     TARGET_DIRNAMES => [
     ],
@@ -50,6 +51,8 @@ for my $line (@lines) {
     my ($body_index, $start, $end, $target) = (split '\s+', $line)[0, 2, 3, 4];
 
     my $from_dirname = sprintf("dump/%03d", $body_index);
+    # Images are dumped only with --debug_dump on the stream mode.
+    next unless -d $from_dirname;
     my $to_dirname = "$output_dirname/$from_dirname";
     File::Path::mkpath($to_dirname);
 
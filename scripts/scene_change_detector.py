@@ -1,57 +1,105 @@
 #!/usr/bin/python
 
-import cv
+import copy
 import cv2
+import fcntl
+import field_features
+import frame_index
+import functools
+import hashlib
+import itertools
 import logging
+import logo_detector
 import math
+import movie_input
+import multiprocessing
 import optparse
 import os
+import raw_video
 import re
+import stage_timer
 import subprocess
 import sys
+import tempfile
+import threading
 import numpy
 
 FRAME_DURATION = 1001 / 30000.0
 HISTOGRAM_BIN_N = 64
+BLACK_ENERGY_WEIGHTS = numpy.arange(256, dtype=numpy.float64) ** 2
+WHITE_ENERGY_WEIGHTS = BLACK_ENERGY_WEIGHTS[::-1].copy()
+DUMP_WIDTH = 480
+DUMP_HEIGHT = 270
 MAX_KEYFRAME_INTERVAL = 30
-
-
-def ParseLogoInformation(logo_name):
-    logo_dir = os.path.join(
-        os.path.abspath(os.path.dirname(__file__)), '../logo')
-    required_keys = set(('offset_x', 'offset_y', 'width', 'height'))
-    info = {}
-    input_filename = '%s/%s.txt' % (logo_dir, logo_name)
-    with open(input_filename) as input_file:
-        for line in input_file:
-            (key, value) = line.split(':')
-            key.strip()
-            value.strip()
-            value = int(value)
-            assert key in required_keys, (
-                'Invalid key "%s" in %s' % (key, input_filename))
-            assert value >= 0, (
-                'Value for key "%s" in %s should be positive' % (
-                    key, input_filename))
-            assert value % 4 == 0, '%s should be in multiples of 4.' % key
-            info[key] = int(value)
-    assert len(required_keys) == len(info), (
-        '%s should have all of %s' % (
-            input_filename, [key for key in required_keys]))
-    return info
+LOGO_RESULT_FILENAME = 'logo.txt'
+COARSE_WIDTH = 160
+COARSE_HEIGHT = 90
+# Coarse distances of luma at least this are refined at the field
+# resolution. Far below the first threshold of Analyze since luma misses
+# changes of colors.
+COARSE_CANDIDATE_THRESHOLD = 0.05
+# Windows are resolved by refining candidates within this number of frames.
+MAX_COARSE_CANDIDATE_SPAN = 3
+# Frames decoded and dropped after a seek without the frame index. Longer
+# than a GOP so that frames after them never refer to frames before the seek
+# point.
+SEEK_PREROLL_FRAMES = 60
+# Sponsor marks are dumped every this seconds over the whole movie.
+SPONSOR_MARK_DUMP_INTERVAL = 2
+SPONSOR_MARK_SAMPLE_PREFIX = 'sample_'
 
 
 def ParseOptions(args=None):
     parser = optparse.OptionParser()
     parser.add_option('--no_dump', dest='no_dump', default=False,
                       help='True if the input movie is already dumped.')
+    parser.add_option('--stream', dest='stream', default=False,
+                      help=('True to calculate histograms from an ffmpeg pipe'
+                            ' instead of dumped images.'))
+    parser.add_option('--debug_dump', dest='debug_dump', default=False,
+                      help=('True to dump images and movies of silence'
+                            ' ranges on the stream mode.'))
+    parser.add_option('--jobs', dest='jobs', type='int', default=1,
+                      help=('The number of processes to analyze silence'
+                            ' ranges. 0 means the number of CPUs.'))
     parser.add_option('--scene_time_filter', dest='scene_time_filter',
                       default=None,
                       help=('Comma-separated [start,duration) of scene'
                             ' start/duration positions in sec.'))
     parser.add_option('--logo_info', dest='logo_info', default=None,
                       help=('logo information for the offset and the size'
-                            'of logo.'))
+                            'of logo. The logo is detected on the fly on the'
+                            ' stream mode.'))
+    parser.add_option('--logo_bisect_step', dest='logo_bisect_step',
+                      type='int', default=1,
+                      help=('Detect the logo every this number of seconds on'
+                            ' the stream mode, and every second within this'
+                            ' number of seconds of silence ranges. Seconds'
+                            ' between them are detected by seeks only where'
+                            ' neighbors disagree.'))
+    parser.add_option('--coarse_to_fine', dest='coarse_to_fine',
+                      default=False,
+                      help=('True to find scene changes in low resolution'
+                            ' luma of the first fields on the stream mode and'
+                            ' to decode only around them at the field'
+                            ' resolution.'))
+    parser.add_option('--field_features', dest='field_features',
+                      default=None,
+                      help=('Directory of features of all fields stored by'
+                            ' live_dumper.py. Silence ranges are not'
+                            ' decoded again if specified.'))
+    parser.add_option('--cache_dir', dest='cache_dir', default='',
+                      help=('Directory of the logo result cache shared'
+                            ' across runs. Disabled if empty.'))
+    parser.add_option('--sponsor_neighborhood', dest='sponsor_neighborhood',
+                      type='float', default=0,
+                      help=('Seconds before and after silence ranges to dump'
+                            ' sponsor marks. 0 dumps them over the whole'
+                            ' movie.'))
+    parser.add_option('--sponsor_interval', dest='sponsor_interval',
+                      type='float', default=SPONSOR_MARK_DUMP_INTERVAL,
+                      help=('Seconds between sponsor marks dumped around'
+                            ' silence ranges.'))
 
     (options, _) = parser.parse_args(args)
 
@@ -65,9 +113,22 @@ def ParseOptions(args=None):
             raise ValueError(
                 'Duration of the CM time filter should be in [0,1)')
 
+    if options.jobs < 0:
+        raise ValueError('The number of jobs should not be negative.')
+    if options.jobs == 0:
+        options.jobs = multiprocessing.cpu_count()
+
+    if options.logo_bisect_step <= 0:
+        raise ValueError('Logo bisect step should be positive.')
+
+    if options.sponsor_neighborhood < 0:
+        raise ValueError('Sponsor neighborhood should not be negative.')
+    if options.sponsor_interval <= 0:
+        raise ValueError('Sponsor interval should be positive.')
+
     if options.logo_info is not None:
         # Smoke test
-        ParseLogoInformation(options.logo_info)
+        logo_detector.ParseLogoInformation(options.logo_info)
 
     return options
 
@@ -101,17 +162,29 @@ def GetLogoDumpDirname():
     return dirname
 
 
-def GetFirstKeyFrameIndex(filename):
+def ProbeMovie(filename):
+    # The start of the original input is the one of the audio.
+    delay = movie_input.GetVideoStart()
+    key_frames = frame_index.LoadKeyFrames()
+    if delay is not None and key_frames and key_frames[0]:
+        return (delay, key_frames[0][0])
+
+    # One run gives both of the start time in the banner and key frames in
+    # the first frames.
     process = subprocess.Popen(
-        ['ffmpeg',
-         '-i', filename,
-         '-vframes', str(MAX_KEYFRAME_INTERVAL),
+        ['ffmpeg'] + movie_input.GetInputArgs(filename) +
+        ['-vframes', str(MAX_KEYFRAME_INTERVAL),
          '-filter:v', 'showinfo',
          '-f', 'null',
          '-y', '/dev/null'],
         stdout=None, stderr=subprocess.PIPE)
     output = process.communicate()[1]
+    if delay is None:
+        delay = ParseDelay(output)
+    return (delay, ParseFirstKeyFrameIndex(output))
+
 
+def ParseFirstKeyFrameIndex(output):
     regex = re.compile(r'\sn:\s*(\d+)\s.+\siskey:1\s')
     for line in output.split('\n'):
         match = regex.search(line)
@@ -147,61 +220,581 @@ def FilterSilenceRanges(options, start, end):
     return result
 
 
-def GetDelay(filename):
-    process = subprocess.Popen(
-        ['ffmpeg', '-i', filename], stdout=None, stderr=subprocess.PIPE)
-    output = process.communicate()[1]
+def ParseDelay(output):
     return float(re.search('Duration:.+start:\s+([\d\.]+)', output).group(1))
 
 
-def DumpImages(options, movie_filename, frame_list):
-    command = ['ffmpeg', '-i', '%s' % movie_filename]
-    for i in xrange(len(frame_list)):
-        dirname = GetDumpDirname(i)
-        start = frame_list[i]['start']
-        end = frame_list[i]['end'] + 1
-        output_filename = '%s/%s.png' % (dirname, '%04d')
-        command.extend([
-                '-filter:v', (
-                    'trim=start_frame=%d:end_frame=%d,separatefields'
-                    ',scale=width=480:height=270' % (start, end)),
-                '-qscale', '0.5',
-                '-an',
-                output_filename])
+def GetSponsorMarkCropFilter():
+    return 'scale=width=1920:height=1080,crop=384:340:768:100'
+
 
+def GetSponsorMarkDumpOutput():
     output_filename = '%s/%s.png' % (GetSponsorMarkDumpDirname(), '%06d')
-    command.extend([
-        '-filter:v', ('fps=fps=0.5:round=down,'
-                      'scale=width=1920:height=1080,crop=384:340:768:100'),
+    return [
+        '-filter:v', 'fps=fps=%g:round=down,%s' % (
+            1.0 / SPONSOR_MARK_DUMP_INTERVAL, GetSponsorMarkCropFilter()),
         '-an',
-        output_filename])
+        output_filename]
+
+
+def GetSponsorMarkSampleRanges(options, ranges):
+    # Returns [start, end] of frames around |ranges| and the step of frames
+    # to sample sponsor marks.
+    margin = TimeToFrameNum(options.sponsor_neighborhood)
+    step = max(1, int(round(options.sponsor_interval / FRAME_DURATION)))
+    return (MergeFrameRanges((max(0, start - margin), end + margin)
+                             for (start, end) in ranges), step)
+
+
+def GetSponsorMarkSampleFrames(options, ranges):
+    (sample_ranges, step) = GetSponsorMarkSampleRanges(options, ranges)
+    frames = []
+    for (start, end) in sample_ranges:
+        frames.extend(xrange(start, end + 1, step))
+    return frames
+
+
+def GetSponsorMarkOutput(options, ranges):
+    # Sponsor marks are only checked between silence ranges. Sampling them
+    # around silence ranges skips OCR of most of the movie.
+    if options.sponsor_neighborhood <= 0:
+        return GetSponsorMarkDumpOutput()
+    (sample_ranges, step) = GetSponsorMarkSampleRanges(options, ranges)
+    if not sample_ranges:
+        return GetSponsorMarkDumpOutput()
+    select = GetRangeSelectExpression(sample_ranges, step)
+    output_filename = '%s/%s%s.png' % (
+        GetSponsorMarkDumpDirname(), SPONSOR_MARK_SAMPLE_PREFIX, '%06d')
+    return [
+        '-filter:v', "select='%s',%s" % (select, GetSponsorMarkCropFilter()),
+        '-vsync', 'passthrough',
+        '-an',
+        output_filename]
 
-    if options.logo_info is not None:
-        logo_info = ParseLogoInformation(options.logo_info)
-        offset_x = logo_info['offset_x']
-        offset_y = logo_info['offset_y']
-        width = logo_info['width']
-        height = logo_info['height']
-
-        extra_offset_x = 4 if offset_x >= 4 else offset_x
-        extra_offset_y = 4 if offset_y >= 4 else offset_y
-        output_filename = '%s/%s.png' % (GetLogoDumpDirname(), '%06d')
-        command.extend([
-            '-filter:v', (
-                'fps=fps=1:round=down'
-                ',crop=%d:%d:%d:%d,yadif,crop=%d:%d:%d:%d' % (
-                    width + 8, height + 8,
-                    offset_x - extra_offset_x, offset_y - extra_offset_y,
-                    width, height, extra_offset_x, extra_offset_y)),
-            '-an',
-            output_filename])
 
-    process = subprocess.Popen(command, stdout=None, stderr=subprocess.PIPE)
-    output = process.communicate()[1]
-    if process.returncode != 0:
+def NameSponsorMarkSamples(options, ranges):
+    # Renames sampled sponsor marks by the index of the dump over the whole
+    # movie, which sponsor_detector_driver.py and scene_filter.pl expect.
+    # Samples in the same interval of the dump are suffixed by a number.
+    if options.sponsor_neighborhood <= 0:
+        return
+    dirname = GetSponsorMarkDumpDirname()
+    last_index = None
+    for (i, frame_num) in enumerate(
+            GetSponsorMarkSampleFrames(options, ranges)):
+        filename = '%s/%s%06d.png' % (
+            dirname, SPONSOR_MARK_SAMPLE_PREFIX, i + 1)
+        if not os.path.isfile(filename):
+            # The movie ends before the frame.
+            break
+        index = int(FrameNumToTime(frame_num) /
+                    SPONSOR_MARK_DUMP_INTERVAL) + 1
+        sub_index = sub_index + 1 if index == last_index else 0
+        last_index = index
+        os.rename(filename,
+                  '%s/%06d_%02d.png' % (dirname, index, sub_index))
+
+
+def GetLogoDumpOutput(options):
+    if options.logo_info is None:
+        return []
+
+    logo_info = logo_detector.ParseLogoInformation(options.logo_info)
+    output_filename = '%s/%s.png' % (GetLogoDumpDirname(), '%06d')
+    return [
+        '-filter:v', logo_detector.GetLogoCropFilter(logo_info, 1),
+        '-an',
+        output_filename]
+
+
+def GetLogoDenseRanges(options, ranges):
+    # Returns ranges of seconds around silence |ranges| of frames, where the
+    # logo is detected every second with --logo_bisect_step.
+    return logo_detector.GetDenseSampleRanges(
+        ((int(FrameNumToTime(start)), int(FrameNumToTime(end)))
+         for (start, end) in ranges),
+        options.logo_bisect_step)
+
+
+def GetLogoStreamOutput(options, output_fd, bisect_step, dense_ranges):
+    # Seconds every |bisect_step| seconds and in |dense_ranges| are streamed
+    # in the order of logo_detector.GetSparseSampleIndices.
+    logo_info = logo_detector.ParseLogoInformation(options.logo_info)
+    select = None
+    if bisect_step > 1:
+        select = 'not(mod(n,%d))' % bisect_step
+        if dense_ranges:
+            select = '%s+%s' % (select,
+                                GetRangeSelectExpression(dense_ranges))
+    return [
+        '-filter:v', logo_detector.GetLogoCropFilter(
+            logo_info, 1, select=select),
+        '-an',
+        '-pix_fmt', 'bgr24',
+        '-f', 'rawvideo',
+        'pipe:%d' % output_fd]
+
+
+def DetectLogo(options, input_fd, errors, bisect_step, dense_ranges,
+               get_input_args):
+    # Runs on another thread to drain the logo output of ffmpeg together
+    # with silence ranges. Closing |input_fd| on errors makes ffmpeg fail
+    # instead of blocking. Seconds between streamed ones are seeked after
+    # the output ends.
+    try:
+        with os.fdopen(input_fd, 'rb') as input_file:
+            with open(LOGO_RESULT_FILENAME, 'w') as output_file:
+                logo_detector.DetectStream(
+                    options.logo_info, input_file, output_file,
+                    cache_dirname=options.cache_dir,
+                    bisect_step=bisect_step, dense_ranges=dense_ranges,
+                    get_input_args=get_input_args)
+    except Exception as e:
+        logging.exception('Failed to detect the logo.')
+        errors.append(e)
+
+
+def OpenLogoStream(options, bisect_step=1, dense_ranges=()):
+    # Returns ffmpeg options of logo crops and both ends of their pipe.
+    (input_fd, output_fd) = os.pipe()
+    fcntl.fcntl(input_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+    return (GetLogoStreamOutput(options, output_fd, bisect_step,
+                                dense_ranges),
+            input_fd, output_fd)
+
+
+def StartLogoDetection(options, input_fd, output_fd, bisect_step=1,
+                       dense_ranges=(), get_input_args=None):
+    # Called after ffmpeg inherits |output_fd|.
+    os.close(output_fd)
+    errors = []
+    thread = threading.Thread(
+        target=DetectLogo,
+        args=(options, input_fd, errors, bisect_step, dense_ranges,
+              get_input_args))
+    thread.daemon = True
+    thread.start()
+    return (thread, errors)
+
+
+def DumpImages(options, movie_filename, frame_list):
+    # Silence ranges are decoded once as one stream. Fields shared by
+    # overlapping ranges are written once and linked to the others.
+    ranges = GetFrameRanges(frame_list)
+    command = ['ffmpeg'] + movie_input.GetInputArgs(movie_filename)
+    if ranges:
+        command.extend(GetFieldStreamOutput(ranges, GetFieldFilter(), 'bgr24'))
+    command.extend(GetSponsorMarkOutput(options, ranges))
+    command.extend(GetLogoDumpOutput(options))
+
+    (process, log_file) = raw_video.OpenRawVideo(command)
+    dirnames = [GetDumpDirname(i) for i in xrange(len(frame_list))]
+    field_nums = [0] * len(frame_list)
+    fields = raw_video.ReadFrames(process.stdout, DUMP_WIDTH, DUMP_HEIGHT)
+    for (_, indices) in WalkFrameWindows(frame_list):
+        # Each frame is separated into the top and the bottom fields.
+        for field in itertools.islice(fields, 2):
+            first_filename = None
+            for i in indices:
+                field_nums[i] = field_nums[i] + 1
+                output_filename = '%s/%04d.png' % (dirnames[i], field_nums[i])
+                if first_filename is None:
+                    cv2.imwrite(output_filename, field)
+                    first_filename = output_filename
+                else:
+                    os.link(first_filename, output_filename)
+    for _ in fields:
+        pass
+
+    (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+    if returncode != 0:
         logging.error(output)
         logging.error('Failed to dump images.')
-        sys.exit(process.returncode)
+        sys.exit(returncode)
+
+
+def GetFrameRanges(frame_list):
+    return MergeFrameRanges(
+        (frame['start'], frame['end']) for frame in frame_list)
+
+
+def WalkFrameWindows(frame_list):
+    # Yields frame numbers in merged ranges of |frame_list| in order with
+    # indices of ranges containing them. Ranges are walked once in order of
+    # their starts, so the cost doesn't depend on the number of ranges.
+    order = sorted(xrange(len(frame_list)),
+                   key=lambda i: frame_list[i]['start'])
+    next_order_index = 0
+    active_indices = []
+    for (start, end) in GetFrameRanges(frame_list):
+        for frame_num in xrange(start, end + 1):
+            while (next_order_index < len(order) and
+                   frame_list[order[next_order_index]]['start'] <= frame_num):
+                active_indices.append(order[next_order_index])
+                next_order_index = next_order_index + 1
+            active_indices = [i for i in active_indices
+                              if frame_num <= frame_list[i]['end']]
+            yield (frame_num, active_indices)
+
+
+def MergeFrameRanges(frame_ranges):
+    ranges = []
+    for (start, end) in sorted(frame_ranges):
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def GetRangeSelectExpression(ranges, step=1):
+    # Returns a select expression of every |step| frames from the starts of
+    # sorted disjoint |ranges|. ffmpeg evaluates only the taken branch of
+    # if(), so a binary tree of ranges by their starts checks O(log N) ranges
+    # per frame instead of all N ranges.
+    if len(ranges) == 1:
+        (start, end) = ranges[0]
+        if step == 1:
+            return 'between(n,%d,%d)' % (start, end)
+        return 'between(n,%d,%d)*not(mod(n-%d,%d))' % (start, end, start, step)
+    middle = len(ranges) // 2
+    return 'if(lt(n,%d),%s,%s)' % (
+        ranges[middle][0],
+        GetRangeSelectExpression(ranges[:middle], step),
+        GetRangeSelectExpression(ranges[middle:], step))
+
+
+def GetFieldStreamOutput(ranges, fields_filter, pix_fmt):
+    select = GetRangeSelectExpression(ranges)
+    return [
+        '-filter:v', "select='%s',%s" % (select, fields_filter),
+        '-vsync', 'passthrough',
+        '-an',
+        '-pix_fmt', pix_fmt,
+        '-f', 'rawvideo',
+        'pipe:1']
+
+
+def OpenFieldStream(options, movie_filename, ranges, fields_filter, pix_fmt):
+    # Decodes |ranges| of frames into fields by |fields_filter| on stdout.
+    # Sponsor marks and the logo are dumped by the same decode unless
+    # --no_dump.
+    command = ['ffmpeg'] + movie_input.GetInputArgs(movie_filename)
+    if ranges:
+        command.extend(GetFieldStreamOutput(ranges, fields_filter, pix_fmt))
+    logo_stream = None
+    logo_dense_ranges = GetLogoDenseRanges(options, ranges)
+    if not options.no_dump:
+        command.extend(GetSponsorMarkOutput(options, ranges))
+        if options.logo_info is not None:
+            # The same decode feeds logo crops through another pipe.
+            logo_stream = OpenLogoStream(
+                options, options.logo_bisect_step, logo_dense_ranges)
+            command.extend(logo_stream[0])
+
+    (process, log_file) = raw_video.OpenRawVideo(command)
+    logo_errors = []
+    logo_thread = None
+    if logo_stream is not None:
+        (logo_thread, logo_errors) = StartLogoDetection(
+            options, logo_stream[1], logo_stream[2],
+            bisect_step=options.logo_bisect_step,
+            dense_ranges=logo_dense_ranges,
+            get_input_args=functools.partial(
+                movie_input.GetInputArgs, movie_filename))
+    return (process, log_file, logo_thread, logo_errors)
+
+
+def CloseFieldStream(process, log_file, logo_thread, logo_errors):
+    (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+    if logo_thread is not None:
+        logo_thread.join()
+    if returncode != 0 or logo_errors:
+        logging.error(output)
+        logging.error('Failed to stream images.')
+        if os.path.exists(LOGO_RESULT_FILENAME):
+            os.remove(LOGO_RESULT_FILENAME)
+        sys.exit(returncode or -1)
+
+
+def GetFieldFilter():
+    return 'separatefields,scale=width=%d:height=%d' % (
+        DUMP_WIDTH, DUMP_HEIGHT)
+
+
+def StreamHistograms(options, movie_filename, frame_list):
+    histograms_list = [[] for _ in frame_list]
+    black_white_energies_list = [[] for _ in frame_list]
+    ranges = GetFrameRanges(frame_list)
+
+    if not ranges and options.no_dump:
+        return (histograms_list, black_white_energies_list)
+
+    stream = OpenFieldStream(
+        options, movie_filename, ranges, GetFieldFilter(), 'bgr24')
+    fields = raw_video.ReadFrames(stream[0].stdout, DUMP_WIDTH, DUMP_HEIGHT)
+    is_debug_dump_enabled = options.debug_dump and not options.no_dump
+    for (_, indices) in WalkFrameWindows(frame_list):
+        # Each frame is separated into the top and the bottom fields.
+        for field in itertools.islice(fields, 2):
+            (histograms, black_white_energy) = CalcFieldFeatures(field)
+            for i in indices:
+                histograms_list[i].append(histograms)
+                black_white_energies_list[i].append(black_white_energy)
+                if is_debug_dump_enabled:
+                    output_filename = '%s/%04d.png' % (
+                        GetDumpDirname(i), len(histograms_list[i]))
+                    cv2.imwrite(output_filename, field)
+    for _ in fields:
+        pass
+
+    CloseFieldStream(*stream)
+    return (histograms_list, black_white_energies_list)
+
+
+def LoadFieldFeatureList(options, frame_list):
+    histograms_list = []
+    black_white_energies_list = []
+    for frame in frame_list:
+        # Each frame is separated into the top and the bottom fields.
+        (histograms, black_white_energies) = (
+            field_features.LoadFieldFeatures(
+                options.field_features, frame['start'] * 2,
+                (frame['end'] + 1) * 2))
+        histograms_list.append(histograms)
+        black_white_energies_list.append(black_white_energies)
+    return (histograms_list, black_white_energies_list)
+
+
+def StreamFeatures(options, movie_filename, frame_list):
+    (histograms_list, black_white_energies_list) = StreamHistograms(
+        options, movie_filename, frame_list)
+    return [(CalcHistogramDistances(histograms), black_white_energies)
+            for (histograms, black_white_energies) in zip(
+                histograms_list, black_white_energies_list)]
+
+
+def IsCoarseToFineEnabled(options):
+    # Features of all fields are needed to dump them or to analyze
+    # filtered ranges.
+    return (options.coarse_to_fine and options.stream and
+            options.field_features is None and
+            options.scene_time_filter is None and not options.debug_dump)
+
+
+def GetCoarseFieldFilter():
+    # The first field of each frame.
+    return ("separatefields,select='not(mod(n,2))'"
+            ",scale=width=%d:height=%d,format=gray" % (
+                COARSE_WIDTH, COARSE_HEIGHT))
+
+
+def CalcCoarseHistogram(coarse_field):
+    histogram = numpy.bincount(
+        coarse_field.ravel() >> 2, minlength=HISTOGRAM_BIN_N)
+    return (histogram.astype(numpy.float32) / coarse_field.size).reshape(
+        (1, HISTOGRAM_BIN_N))
+
+
+def CalcCoarseDigest(coarse_field):
+    return hashlib.sha1(coarse_field.tobytes()).hexdigest()
+
+
+def StreamCoarseFields(options, movie_filename, frame_list):
+    # Returns luma histograms and digests of coarse fields of each frame.
+    histograms_list = [[] for _ in frame_list]
+    digests_list = [[] for _ in frame_list]
+    ranges = GetFrameRanges(frame_list)
+
+    if not ranges and options.no_dump:
+        return (histograms_list, digests_list)
+
+    stream = OpenFieldStream(
+        options, movie_filename, ranges, GetCoarseFieldFilter(), 'gray')
+    coarse_fields = raw_video.ReadFrames(
+        stream[0].stdout, COARSE_WIDTH, COARSE_HEIGHT, channels=1)
+    for ((_, indices), coarse_field) in itertools.izip(
+            WalkFrameWindows(frame_list), coarse_fields):
+        histogram = CalcCoarseHistogram(coarse_field)
+        digest = CalcCoarseDigest(coarse_field)
+        for i in indices:
+            histograms_list[i].append(histogram)
+            digests_list[i].append(digest)
+    for _ in coarse_fields:
+        pass
+
+    CloseFieldStream(*stream)
+    return (histograms_list, digests_list)
+
+
+def GetSeekFrame(frame_num):
+    # Returns the frame to seek to for decoding from |frame_num| and its time
+    # from the first frame.
+    key_frame = frame_index.FindKeyFrame(frame_num)
+    if key_frame is not None:
+        return key_frame
+    seek_frame = max(0, frame_num - SEEK_PREROLL_FRAMES)
+    return (seek_frame, FrameNumToTime(seek_frame))
+
+
+def SeekFields(movie_filename, start, end):
+    # Decodes frames in [start, end] after seeking near them. Returns
+    # histograms and gray scale histograms of fields and digests of coarse
+    # fields to check that the seek reproduces the sequential decode.
+    (seek_frame, seek_time) = GetSeekFrame(start)
+    (fd, coarse_filename) = tempfile.mkstemp(prefix='coarse', suffix='.raw')
+    os.close(fd)
+    # Half a frame before so that trim counts frames from |seek_frame|.
+    command = ['ffmpeg'] + movie_input.GetInputArgs(
+        movie_filename,
+        seek_time - FrameNumToTime(0.5) if seek_frame > 0 else None)
+    command.extend([
+        '-filter_complex', (
+            '[0:v]trim=start_frame=%d:end_frame=%d,split[fields][coarse];'
+            '[fields]%s[fields_output];[coarse]%s[coarse_output]' % (
+                start - seek_frame, end + 1 - seek_frame,
+                GetFieldFilter(), GetCoarseFieldFilter())),
+        '-map', '[fields_output]',
+        '-vsync', 'passthrough',
+        '-pix_fmt', 'bgr24',
+        '-f', 'rawvideo',
+        'pipe:1',
+        '-map', '[coarse_output]',
+        '-vsync', 'passthrough',
+        '-pix_fmt', 'gray',
+        '-f', 'rawvideo',
+        '-y', coarse_filename])
+    try:
+        (process, log_file) = raw_video.OpenRawVideo(command)
+        histograms = []
+        black_white_energies = []
+        for field in raw_video.ReadFrames(
+                process.stdout, DUMP_WIDTH, DUMP_HEIGHT):
+            (field_histograms, black_white_energy) = CalcFieldFeatures(field)
+            histograms.append(field_histograms)
+            black_white_energies.append(black_white_energy)
+        (returncode, output) = raw_video.CloseRawVideo(process, log_file)
+        if returncode != 0:
+            logging.error(output)
+            return None
+        with open(coarse_filename, 'rb') as coarse_file:
+            digests = [CalcCoarseDigest(coarse_field)
+                       for coarse_field in raw_video.ReadFrames(
+                           coarse_file, COARSE_WIDTH, COARSE_HEIGHT,
+                           channels=1)]
+    finally:
+        os.remove(coarse_filename)
+    return (histograms, black_white_energies, digests)
+
+
+def SeekFeatures(movie_filename, frame, coarse_digests):
+    # Returns None unless the seek reproduces the coarse fields.
+    fields = SeekFields(movie_filename, frame['start'], frame['end'])
+    if fields is None or fields[2] != coarse_digests:
+        return None
+    return (CalcHistogramDistances(fields[0]), fields[1])
+
+
+def SeekFeaturesJob(args):
+    return SeekFeatures(*args)
+
+
+def GetFirstThresholdRange(options, frame):
+    # [start, end) of distances checked by the first threshold of Analyze.
+    distance_num = (frame['end'] - frame['start']) * 2 + 1
+    check_first_frame = frame['start'] < MAX_KEYFRAME_INTERVAL
+    trim = 14
+    if trim * 3 > distance_num:
+        trim = distance_num / 3
+    return (0 if check_first_frame else trim, distance_num - trim)
+
+
+def FindCoarseCandidates(options, frame, coarse_histograms):
+    # Returns [start, end] of frames around the only scene change candidate
+    # of a window or None. Candidates only tell where to stop decoding.
+    if len(coarse_histograms) < 2:
+        return None
+    (first, last) = GetFirstThresholdRange(options, frame)
+    coarse_distances = CalcEmdDistances(numpy.array(coarse_histograms))
+    # A coarse distance between frames k and k + 1 covers distances 2k and
+    # 2k + 1 of fields.
+    candidates = [k for (k, distance) in enumerate(coarse_distances)
+                  if distance >= COARSE_CANDIDATE_THRESHOLD and
+                  first <= k * 2 + 1 and k * 2 < last]
+    if not candidates:
+        return None
+    if candidates[-1] - candidates[0] >= MAX_COARSE_CANDIDATE_SPAN:
+        return None
+    return (max(0, candidates[0] - 1),
+            min(len(coarse_histograms) - 1, candidates[-1] + 2))
+
+
+def ResolveWindow(args):
+    # Returns the result of Analyze and features of a window. Features are
+    # None if the window is resolved around a coarse candidate. Both are
+    # None if seeks don't reproduce the coarse fields.
+    (options, movie_filename, frame, coarse_histograms, coarse_digests) = args
+    candidate = FindCoarseCandidates(options, frame, coarse_histograms)
+    if candidate is not None and frame['filtered_ranges']:
+        # Coarse luma distances don't bound distances of color fields, e.g.
+        # of a cut changing only chroma. Fields are decoded from the start of
+        # the first threshold range, so that the first crossing in them is
+        # the first one of Analyze.
+        (first, last) = GetFirstThresholdRange(options, frame)
+        start = min(first // 2, candidate[0])
+        end = candidate[1]
+        fields = SeekFields(
+            movie_filename, frame['start'] + start, frame['start'] + end)
+        if fields is None or fields[2] != coarse_digests[start:end + 1]:
+            return (None, None)
+        distances = CalcHistogramDistances(fields[0])
+        for (i, distance) in enumerate(distances, start * 2):
+            # The same as the first threshold of Analyze.
+            if first <= i < last and distance >= 0.3:
+                return (i + 1, None)
+
+    features = SeekFeatures(movie_filename, frame, coarse_digests)
+    if features is None:
+        return (None, None)
+    return (Analyze(options, frame, *features), features)
+
+
+def AnalyzeCoarseToFine(options, movie_filename, frame_list):
+    # Returns results of Analyze, features and digests of coarse fields.
+    with stage_timer.Span('coarse'):
+        (coarse_histograms_list, coarse_digests_list) = StreamCoarseFields(
+            options, movie_filename, frame_list)
+    with stage_timer.Span('refine'):
+        resolved_list = MapJobs(options, ResolveWindow, [
+            (options, movie_filename, frame_list[i], coarse_histograms_list[i],
+             coarse_digests_list[i])
+            for i in xrange(len(frame_list))])
+    results = [result for (result, _) in resolved_list]
+    features_list = [features for (_, features) in resolved_list]
+
+    # Seeks may not reproduce the sequential decode, e.g. on broken
+    # timestamps. Such windows are decoded sequentially.
+    indices = [i for (i, result) in enumerate(results) if result is None]
+    if indices:
+        logging.warning('Failed to seek %d silence ranges.', len(indices))
+        with stage_timer.Span('histogram'):
+            CompleteFeaturesList(options, movie_filename, frame_list,
+                                 features_list, indices)
+        for i in indices:
+            results[i] = Analyze(options, frame_list[i], *features_list[i])
+    return (results, features_list, coarse_digests_list)
+
+
+def CompleteFeaturesList(options, movie_filename, frame_list, features_list,
+                         indices):
+    # Calculates features of |indices| sequentially without dumps.
+    stream_options = copy.copy(options)
+    stream_options.no_dump = True
+    stream_options.debug_dump = False
+    for (i, features) in zip(indices, StreamFeatures(
+            stream_options, movie_filename,
+            [frame_list[i] for i in indices])):
+        features_list[i] = features
 
 
 def CreateDumpedMovie(index):
@@ -221,13 +814,32 @@ def CreateDumpedMovie(index):
     if process.returncode != 0:
         logging.error(output)
         logging.error('Failed to create a dumped movie. index:%d.', index)
-        sys.exit(process.returncode)
+    return process.returncode
+
+
+def CreateDumpedMovies(options, frame_list):
+    # Don't exit in workers, which makes the pool wait for them forever.
+    for returncode in MapJobs(
+            options, CreateDumpedMovie, range(len(frame_list))):
+        if returncode != 0:
+            sys.exit(returncode)
 
 
 def Dump(options, movie_filename, frame_list):
     DumpImages(options, movie_filename, frame_list)
-    for i in xrange(len(frame_list)):
-        CreateDumpedMovie(i)
+    CreateDumpedMovies(options, frame_list)
+
+
+def MapJobs(options, function, args_list):
+    if options.jobs <= 1 or len(args_list) <= 1:
+        return map(function, args_list)
+    pool = multiprocessing.Pool(min(options.jobs, len(args_list)))
+    try:
+        # Results are in the order of args_list.
+        return pool.map(function, args_list, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
 
 
 def GetImageFilenames(image_dirname):
@@ -268,58 +880,73 @@ def AnalyzeMovie(dirname):
 
 def LoadHistogramsBgr(filename):
     im = cv2.imread(filename)
-    if im == None:
+    if im is None:
         logging.error('Failed to load image as BGR. [%s]', filename)
         return None
-    histograms = []
-    for channel in cv2.split(im):
+    return CalcHistogramsBgr(im)
+
+
+def CalcHistogramsBgr(im):
+    histograms = numpy.empty((3, HISTOGRAM_BIN_N), dtype=numpy.float32)
+    for (i, channel) in enumerate(cv2.split(im)):
         histogram = cv2.calcHist(
             [channel], [0], None, [HISTOGRAM_BIN_N], [0, 256])
         cv2.normalize(histogram, histogram, alpha=1, norm_type=cv2.NORM_L1)
-        histograms.append(histogram)
+        histograms[i] = histogram.ravel()
     return histograms
 
 
-def ConvertForEmd(histogram):
-    array = [(histogram[i][0], i)
-             for i in xrange(HISTOGRAM_BIN_N)
-             if histogram[i] > 0]
-    f64 = cv.fromarray(numpy.array(array))
-    f32 = cv.CreateMat(f64.rows, f64.cols, cv.CV_32FC1)
-    cv.Convert(f64, f32)
-    return f32
+# Returns EMDs between consecutive histograms in (N, 3, HISTOGRAM_BIN_N).
+# Bins are one-dimensional with L2 ground distance and each histogram is
+# L1-normalized, so the EMD of a channel equals the L1 distance of the
+# cumulative histograms. Results match cv.CalcEMD2 within 1e-5.
+def CalcEmdDistances(histograms):
+    cumulative_histograms = numpy.cumsum(histograms, axis=2,
+                                         dtype=numpy.float64)
+    distances = numpy.abs(numpy.diff(cumulative_histograms, axis=0)).sum(
+        axis=2) / HISTOGRAM_BIN_N
+    return numpy.sqrt((distances ** 2).sum(axis=1))
 
 
-def CalcEmd(histograms1, histograms2):
-    result = 0
-    for i in xrange(len(histograms1)):
-        data1 = ConvertForEmd(histograms1[i])
-        data2 = ConvertForEmd(histograms2[i])
-        distance = cv.CalcEMD2(data1, data2, cv.CV_DIST_L2) / HISTOGRAM_BIN_N
-        result = result + distance ** 2
-    return result ** 0.5
+def CalcHistogramDistances(histograms_list):
+    if len(histograms_list) < 2:
+        return []
+    return CalcEmdDistances(numpy.array(histograms_list)).tolist()
 
 
 def LoadHistogramDistances(image_dirname):
     image_filenames = GetImageFilenames(image_dirname)
-    histograms_list = [LoadHistogramsBgr(filename) for filename in image_filenames]
-    return [CalcEmd(histograms_list[i - 1], histograms_list[i])
-            for i in xrange(1, len(histograms_list))]
+    return CalcHistogramDistances(
+        [LoadHistogramsBgr(filename) for filename in image_filenames])
 
 
-def LoadGrayScaleHistogram(filename):
-    im = cv2.cvtColor(cv2.imread(filename), cv2.COLOR_BGR2GRAY)
-    if im == None:
-        logging.error('Failed to load image as HSV. [%s]', filename)
+def LoadFieldFeatures(filename):
+    im = cv2.imread(filename)
+    if im is None:
+        logging.error('Failed to load image as BGR. [%s]', filename)
         return None
+    return CalcFieldFeatures(im)
+
+
+# Returns BGR histograms and the black/white energy of a field decoded once.
+def CalcFieldFeatures(bgr_image):
+    return (CalcHistogramsBgr(bgr_image), CalcBlackWhiteEnergy(bgr_image))
+
+
+def CalcGrayScaleHistogram(bgr_image):
+    im = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY)
     histogram = cv2.calcHist(im, [0], None, [256], [0, 256])
     cv2.normalize(histogram, histogram, 0, 255, cv2.NORM_L1)
     return histogram
 
 
-def LoadGrayScaleHistogramList(image_dirname):
-    image_filenames = GetImageFilenames(image_dirname)
-    return [LoadGrayScaleHistogram(filename) for filename in image_filenames]
+# Returns sums of the gray scale histogram weighted by squared distances from
+# black and white. Small ones mean black and white frames respectively.
+def CalcBlackWhiteEnergy(bgr_image):
+    histogram = CalcGrayScaleHistogram(bgr_image).ravel().astype(
+        numpy.float64)
+    return numpy.array([histogram.dot(BLACK_ENERGY_WEIGHTS),
+                        histogram.dot(WHITE_ENERGY_WEIGHTS)])
 
 
 def AnalyzeDistances(
@@ -335,21 +962,18 @@ def AnalyzeDistances(
     return results[0] if len(results) >= 1 else 0
 
 
-def AnalyzeBlackWhiteFrame(gray_histograms, check_first_frame):
-    for loop in xrange(2):
-        prev_total = 1e5  # 1e4 < 1e5 < 1e7
-        for hist_i in xrange(len(gray_histograms)):
-            histogram = gray_histograms[hist_i].tolist()
-            # Check white or black frame
-            if loop == 1:
-                histogram.reverse()
-            total = 0
-            for i in xrange(len(histogram)):
-                total = total + histogram[i][0] * i ** 2
-            if ((total < 1e4 and prev_total > 1e7) or
-                (total > 1e7 and prev_total < 1e4)):
-                return hist_i
-            prev_total = total
+def AnalyzeBlackWhiteFrame(black_white_energies, check_first_frame):
+    black_white_energies = numpy.asarray(
+        black_white_energies, dtype=numpy.float64).reshape((-1, 2))
+    # Energies from black first, then ones from white.
+    for totals in black_white_energies.T:
+        # 1e4 < 1e5 < 1e7
+        prev_totals = numpy.concatenate(([1e5], totals[:-1]))
+        transitions = numpy.flatnonzero(
+            ((totals < 1e4) & (prev_totals > 1e7)) |
+            ((totals > 1e7) & (prev_totals < 1e4)))
+        if len(transitions) > 0:
+            return int(transitions[0])
     return 0
 
 
@@ -359,7 +983,7 @@ def AnalyzeLastResort(distances, threshold):
     return result if max_value > threshold else -result
 
 
-def Analyze(options, dump_dirname, frame):
+def Analyze(options, frame, distances, black_white_energies):
     if not frame['filtered_ranges']:
         return -1
 
@@ -371,7 +995,6 @@ def Analyze(options, dump_dirname, frame):
         check_first_frame = frame['start'] < MAX_KEYFRAME_INTERVAL
         trim_frames = 14
 
-    distances = LoadHistogramDistances(dump_dirname)
     assert len(distances) == (frame['end'] - frame['start']) * 2 + 1, (
         'Cannot load the histograms of the dumped images.')
 
@@ -391,9 +1014,8 @@ def Analyze(options, dump_dirname, frame):
         if scene_change_frame > 0:
             return scene_change_frame + start_offsets[i]
 
-    gray_histograms = LoadGrayScaleHistogramList(dump_dirname)
     scene_change_frame = AnalyzeBlackWhiteFrame(
-        gray_histograms, check_first_frame=check_first_frame)
+        black_white_energies, check_first_frame=check_first_frame)
     if scene_change_frame > 0:
         return scene_change_frame + start_offsets[i]
 
@@ -427,6 +1049,95 @@ def Analyze(options, dump_dirname, frame):
     return fallback_frame
 
 
+def AnalyzeFeatures(args):
+    (options, frame, distances, black_white_energies) = args
+    return Analyze(options, frame, distances, black_white_energies)
+
+
+def LoadDumpedFeatures(index):
+    histograms = []
+    black_white_energies = []
+    for filename in GetImageFilenames(GetDumpDirname(index)):
+        features = LoadFieldFeatures(filename)
+        if features is None:
+            continue
+        histograms.append(features[0])
+        black_white_energies.append(features[1])
+    return (CalcHistogramDistances(histograms),
+            numpy.array(black_white_energies, dtype=numpy.float64))
+
+
+def GetFeaturesFilename(scene_index):
+    dirname = 'features'
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    return '%s/%03d.npz' % (dirname, scene_index)
+
+
+def SaveFeaturesList(frame_list, features_list, coarse_digests_list=None):
+    # Windows resolved by --coarse_to_fine have no features. Digests of
+    # their coarse fields are stored to verify seeks of the next pass.
+    for (i, frame) in enumerate(frame_list):
+        if features_list[i] is None:
+            numpy.savez_compressed(
+                GetFeaturesFilename(i),
+                start=frame['start'],
+                end=frame['end'],
+                coarse_digests=numpy.array(coarse_digests_list[i]))
+            continue
+        (distances, black_white_energies) = features_list[i]
+        numpy.savez_compressed(
+            GetFeaturesFilename(i),
+            start=frame['start'],
+            end=frame['end'],
+            distances=numpy.array(distances, dtype=numpy.float64),
+            black_white_energies=numpy.array(black_white_energies,
+                                             dtype=numpy.float64))
+
+
+def LoadFeaturesList(frame_list):
+    # Returns None unless features of all ranges are stored. Features of
+    # ranges resolved by --coarse_to_fine are None.
+    features_list = []
+    for (i, frame) in enumerate(frame_list):
+        filename = GetFeaturesFilename(i)
+        if not os.path.isfile(filename):
+            return None
+        features = numpy.load(filename)
+        # Only filtered ranges may differ from the stored ones.
+        if (int(features['start']) != frame['start'] or
+            int(features['end']) != frame['end']):
+            logging.error('Stored features mismatch. [%s]', filename)
+            return None
+        if 'distances' not in features.files:
+            features_list.append(None)
+            continue
+        features_list.append((features['distances'].tolist(),
+                              features['black_white_energies']))
+    return features_list
+
+
+def CompleteStoredFeaturesList(options, movie_filename, frame_list,
+                               features_list):
+    # Calculates features of ranges resolved by --coarse_to_fine.
+    indices = [i for (i, features) in enumerate(features_list)
+               if features is None]
+    if not indices:
+        return
+    coarse_digests_list = [
+        numpy.load(GetFeaturesFilename(i))['coarse_digests'].tolist()
+        for i in indices]
+    for (i, features) in zip(indices, MapJobs(options, SeekFeaturesJob, [
+            (movie_filename, frame_list[i], coarse_digests)
+            for (i, coarse_digests) in zip(indices, coarse_digests_list)])):
+        features_list[i] = features
+    indices = [i for i in indices if features_list[i] is None]
+    if indices:
+        logging.warning('Failed to seek %d silence ranges.', len(indices))
+        CompleteFeaturesList(options, movie_filename, frame_list,
+                             features_list, indices)
+
+
 def LoadSilenceFrameList(options, silence_filename, audio_delay,
                          firstKeyFrameIndex):
     start_time = FrameNumToTime(firstKeyFrameIndex) + 1e-8
@@ -461,7 +1172,7 @@ def Main():
     if not os.path.isfile(silence_filename):
         logging.error('%s is not found.', silence_filename)
         return
-    if not os.path.isfile(movie_filename):
+    if not movie_input.Exists(movie_filename):
         logging.error('%s is not a file.', movie_filename)
         return
     if os.path.isfile(output_filename):
@@ -469,16 +1180,67 @@ def Main():
         return
 
     options = ParseOptions()
+    if (options.stream and options.logo_info is not None and
+        not options.no_dump and os.path.exists(LOGO_RESULT_FILENAME)):
+        logging.error('%s already exists.', LOGO_RESULT_FILENAME)
+        return
+    with stage_timer.Span('probe'):
+        (delay, first_key_frame_index) = ProbeMovie(movie_filename)
     frame_list = LoadSilenceFrameList(
-        options, silence_filename, GetDelay(movie_filename),
-        GetFirstKeyFrameIndex(movie_filename))
-
-    if not options.no_dump:
-        # TODO: Extract dump logic as another script.
-        Dump(options, movie_filename, frame_list)
-
-    results = [Analyze(options, GetDumpDirname(i), frame_list[i])
-               for i in xrange(len(frame_list))]
+        options, silence_filename, delay, first_key_frame_index)
+
+    features_list = None
+    coarse_digests_list = None
+    results = None
+    if options.no_dump:
+        # The first pass stores features, which don't depend on
+        # --scene_time_filter.
+        features_list = LoadFeaturesList(frame_list)
+        if features_list is not None:
+            with stage_timer.Span('histogram'):
+                CompleteStoredFeaturesList(
+                    options, movie_filename, frame_list, features_list)
+    if features_list is None:
+        if IsCoarseToFineEnabled(options):
+            # Only windows with ambiguous coarse candidates are analyzed at
+            # the field resolution.
+            (results, features_list, coarse_digests_list) = (
+                AnalyzeCoarseToFine(options, movie_filename, frame_list))
+        elif options.field_features is not None:
+            # Sponsor marks and the logo are already dumped while recording.
+            with stage_timer.Span('histogram'):
+                (histograms_list, black_white_energies_list) = (
+                    LoadFieldFeatureList(options, frame_list))
+                features_list = [
+                    (CalcHistogramDistances(histograms), black_white_energies)
+                    for (histograms, black_white_energies) in zip(
+                        histograms_list, black_white_energies_list)]
+        elif options.stream:
+            # Frames are decoded while histograms are calculated.
+            with stage_timer.Span('histogram'):
+                features_list = StreamFeatures(
+                    options, movie_filename, frame_list)
+            if options.debug_dump and not options.no_dump:
+                with stage_timer.Span('dump'):
+                    CreateDumpedMovies(options, frame_list)
+        else:
+            if not options.no_dump:
+                # TODO: Extract dump logic as another script.
+                with stage_timer.Span('dump'):
+                    Dump(options, movie_filename, frame_list)
+            with stage_timer.Span('histogram'):
+                features_list = MapJobs(
+                    options, LoadDumpedFeatures, range(len(frame_list)))
+        if not options.no_dump:
+            if options.field_features is None:
+                NameSponsorMarkSamples(options, GetFrameRanges(frame_list))
+            SaveFeaturesList(frame_list, features_list, coarse_digests_list)
+
+    if results is None:
+        with stage_timer.Span('analyze'):
+            results = MapJobs(options, AnalyzeFeatures, [
+                (options, frame_list[i]) + tuple(features_list[i])
+                for i in xrange(len(frame_list))])
 
     assert len(frame_list) == len(results)
     with open(output_filename, 'w') as output_file:
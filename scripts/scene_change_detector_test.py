@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+# Compares the streaming and vectorized parts of scene_change_detector.py
+# with the per-window and per-histogram implementations of the baseline.
+
+import cv2
+import numpy
+import random
+import re
+import unittest
+
+import scene_change_detector
+
+
+def CalcBaselineEmd(histograms1, histograms2):
+    # CalcEmd of the baseline by cv.CalcEMD2, whose successor is cv2.EMD.
+    result = 0
+    for (histogram1, histogram2) in zip(histograms1, histograms2):
+        signatures = []
+        for histogram in (histogram1, histogram2):
+            signatures.append(numpy.array(
+                [(weight, i) for (i, weight) in enumerate(histogram)
+                 if weight > 0], dtype=numpy.float32))
+        (distance, _, _) = cv2.EMD(signatures[0], signatures[1],
+                                   cv2.DIST_L2)
+        distance = distance / scene_change_detector.HISTOGRAM_BIN_N
+        result = result + distance ** 2
+    return result ** 0.5
+
+
+def EvaluateSelectExpression(expression, n):
+    # Evaluates an ffmpeg select expression of between(), lt(), mod(),
+    # not() and if() for the frame |n|.
+    functions = {
+        'between': lambda x, start, end: int(start <= x <= end),
+        'lt': lambda x, y: int(x < y),
+        'mod': lambda x, y: x % y,
+        'not_': lambda x: int(not x),
+        'if_': lambda condition, x, y: x if condition else y,
+        'n': n,
+    }
+    return eval(re.sub(r'\b(not|if)\(', r'\1_(', expression), functions)
+
+
+def CreateFrameList(random_generator, num):
+    frame_list = []
+    for _ in xrange(num):
+        start = random_generator.randint(0, 500)
+        frame_list.append({
+            'start': start,
+            'end': start + random_generator.randint(0, 60),
+        })
+    return frame_list
+
+
+class SceneChangeDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(0)
+
+    def testMergeFrameRanges(self):
+        for _ in xrange(100):
+            frame_list = CreateFrameList(self.random, 10)
+            frames = set()
+            for frame in frame_list:
+                frames.update(xrange(frame['start'], frame['end'] + 1))
+            ranges = scene_change_detector.MergeFrameRanges(
+                (frame['start'], frame['end']) for frame in frame_list)
+            merged_frames = []
+            for (start, end) in ranges:
+                merged_frames.extend(xrange(start, end + 1))
+            self.assertEqual(sorted(frames), merged_frames)
+            # Adjacent ranges are merged too.
+            for i in xrange(1, len(ranges)):
+                self.assertGreater(ranges[i][0], ranges[i - 1][1] + 1)
+
+    def testWalkFrameWindows(self):
+        # The baseline decoded each window separately, so each window
+        # should see all of its frames in order.
+        for _ in xrange(100):
+            frame_list = CreateFrameList(self.random, 10)
+            window_frames = [[] for _ in frame_list]
+            walked_frames = []
+            for (frame_num, indices) in (
+                    scene_change_detector.WalkFrameWindows(frame_list)):
+                walked_frames.append(frame_num)
+                for i in indices:
+                    window_frames[i].append(frame_num)
+            self.assertEqual(sorted(set(walked_frames)), walked_frames)
+            for (frame, frames) in zip(frame_list, window_frames):
+                self.assertEqual(
+                    range(frame['start'], frame['end'] + 1), frames)
+
+    def testCalcEmdDistances(self):
+        images = [numpy.zeros((36, 64, 3), dtype=numpy.uint8)]
+        for _ in xrange(5):
+            image = numpy.random.RandomState(
+                self.random.randint(0, 1000)).randint(
+                    0, 256, size=(36, 64, 3)).astype(numpy.uint8)
+            images.append(image)
+            # Images with few colors have sparse histograms.
+            images.append(image // 64 * 64)
+        histograms = [scene_change_detector.CalcHistogramsBgr(image)
+                      for image in images]
+        distances = scene_change_detector.CalcHistogramDistances(histograms)
+        self.assertEqual(len(images) - 1, len(distances))
+        for i in xrange(1, len(histograms)):
+            self.assertAlmostEqual(
+                CalcBaselineEmd(histograms[i - 1], histograms[i]),
+                distances[i - 1], delta=1e-5)
+        self.assertEqual([], scene_change_detector.CalcHistogramDistances(
+            histograms[:1]))
+
+    def testGetRangeSelectExpression(self):
+        for step in (1, 3):
+            for _ in xrange(20):
+                frame_list = CreateFrameList(self.random, 8)
+                ranges = scene_change_detector.MergeFrameRanges(
+                    (frame['start'], frame['end']) for frame in frame_list)
+                expression = (
+                    scene_change_detector.GetRangeSelectExpression(
+                        ranges, step))
+                expected = set()
+                for (start, end) in ranges:
+                    expected.update(xrange(start, end + 1, step))
+                selected = set(
+                    n for n in xrange(600)
+                    if EvaluateSelectExpression(expression, n))
+                self.assertEqual(expected, selected)
+
+
+if __name__ == '__main__':
+    unittest.main()
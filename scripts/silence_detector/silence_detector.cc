@@ -74,7 +74,15 @@ string SamplingToTime(size_t sampling_counter, size_t sampling_rate) {
 }
 
 void help(const char *program_name) {
-  cerr << "Usage: " << program_name << " [--aggressive_analysis] filename" << endl;
+  cerr << "Usage: " << program_name << " [--aggressive_analysis] filename"
+       << endl
+       << "Specify - as filename to read from stdin." << endl;
+}
+
+// Reads up to |size| bytes. Fewer bytes are read only at the end of input.
+size_t ReadBytes(istream *is, char *buf, size_t size) {
+  is->read(buf, size);
+  return static_cast<size_t>(is->gcount());
 }
 
 int main(int argc, char *argv[]) {
@@ -96,77 +104,91 @@ int main(int argc, char *argv[]) {
     enable_aggressive_analysis = true;
   }
 
-  ifstream ifs(input_filename.c_str());
-  if (!ifs) {
-    cerr << "Failed to open file: " << argv[1] << endl;
-    return -1;
+  // Sizes in the header of a wav from a pipe are unknown. Samples are read
+  // until the end of input in that case.
+  const size_t kUnknownSize = 0xFFFFFFFF;
+  size_t file_size = kUnknownSize;
+  istream *is = &cin;
+  ifstream ifs;
+  if (input_filename != "-") {
+    ifs.open(input_filename.c_str(), ios::in | ios::binary);
+    if (!ifs) {
+      cerr << "Failed to open file: " << input_filename << endl;
+      return -1;
+    }
+    ifs.seekg(0, std::ios::end);
+    file_size = static_cast<size_t>(ifs.tellg());
+    ifs.seekg(0, std::ios::beg);
+    is = &ifs;
   }
-  ifs.seekg(0, std::ios::end);
-  const size_t file_size = static_cast<size_t>(ifs.tellg());
-  ifs.seekg(0, std::ios::beg);
 
+  // The header is parsed in the first block of input.
+  const size_t kMaxHeaderSize = 1024;
   // + 1 is for 24bit PCM (ReadNumber)
-  char *file_buf_head = new char[file_size + 1];
-  char *file_buf_ptr = file_buf_head;
-  if (!ifs.read(file_buf_head, file_size)) {
-    cerr << "Failed to read the file." << endl;
-    return -1;
-  }
+  char header_buf[kMaxHeaderSize + 1];
+  const size_t header_buf_size = ReadBytes(is, header_buf, kMaxHeaderSize);
+  char *header_buf_ptr = header_buf;
 
-  if (!CompareCharacters("RIFF", &file_buf_ptr)) {
+  if (header_buf_size < 12 || !CompareCharacters("RIFF", &header_buf_ptr)) {
     cerr << "Invalid RIFF format." << endl;
     return -1;
   }
 
-  if (ReadUnsignedInt(&file_buf_ptr) + 8 != file_size) {
+  const size_t riff_size = ReadUnsignedInt(&header_buf_ptr);
+  if (file_size != kUnknownSize && riff_size != kUnknownSize &&
+      riff_size + 8 != file_size) {
     cerr << "Invalid file size." << endl;
-    cerr << "pos: " << (file_buf_ptr - file_buf_head) << endl;
+    cerr << "pos: " << (header_buf_ptr - header_buf) << endl;
     return -1;
   }
 
-  if (!CompareCharacters("WAVEfmt ", &file_buf_ptr)) {
+  if (!CompareCharacters("WAVEfmt ", &header_buf_ptr)) {
     cerr << "Invalid WAVE format." << endl;
-    cerr << "pos: " << (file_buf_ptr - file_buf_head) << endl;
+    cerr << "pos: " << (header_buf_ptr - header_buf) << endl;
     return -1;
   }
 
-  const size_t fmt_size = ReadUnsignedInt(&file_buf_ptr);
-  const unsigned short format_id = ReadUnsignedShort(&file_buf_ptr);
+  const size_t fmt_size = ReadUnsignedInt(&header_buf_ptr);
+  char *fmt_end_ptr = header_buf_ptr + fmt_size;
+  const unsigned short format_id = ReadUnsignedShort(&header_buf_ptr);
 
-  const int channel_num = ReadUnsignedShort(&file_buf_ptr);
-  const int sampling_rate = ReadUnsignedInt(&file_buf_ptr);
+  const int channel_num = ReadUnsignedShort(&header_buf_ptr);
+  const int sampling_rate = ReadUnsignedInt(&header_buf_ptr);
   const int sampling_bytes =
-    ReadUnsignedInt(&file_buf_ptr) / channel_num / sampling_rate;
+    ReadUnsignedInt(&header_buf_ptr) / channel_num / sampling_rate;
   if (sampling_bytes < 2 || 4 < sampling_bytes) {
     cerr << "Unsupported sampling bytes: " << sampling_bytes << endl;
     return -1;
   }
-  if (ReadUnsignedShort(&file_buf_ptr) != channel_num * sampling_bytes) {
+  const size_t block_size = channel_num * sampling_bytes;
+  if (ReadUnsignedShort(&header_buf_ptr) != block_size) {
     cerr << "Invalid block size." << endl;
     return -1;
   }
-  if (ReadUnsignedShort(&file_buf_ptr) != sampling_bytes * 8) {
+  if (ReadUnsignedShort(&header_buf_ptr) != sampling_bytes * 8) {
     cerr << "Invalid sampling bits." << endl;
     return -1;
   }
 
-  const size_t extend_header_size = ReadUnsignedShort(&file_buf_ptr);
-  file_buf_ptr += extend_header_size;
+  // Skip the extension of the format, e.g. WAVE_FORMAT_EXTENSIBLE.
+  header_buf_ptr = fmt_end_ptr;
 
   while (true) {
-    if (file_buf_ptr - file_buf_head > 1024 - 4) {
+    if (static_cast<size_t>(header_buf_ptr - header_buf) + 8 > header_buf_size) {
       cerr << "Too big header." << endl;
       return -1;
     }
-    if (CompareCharacters("data", &file_buf_ptr)) {
+    if (CompareCharacters("data", &header_buf_ptr)) {
       break;
     }
-    size_t chunk_size = ReadUnsignedInt(&file_buf_ptr);
-    file_buf_ptr += chunk_size;
+    size_t chunk_size = ReadUnsignedInt(&header_buf_ptr);
+    header_buf_ptr += chunk_size;
   }
 
-  const size_t data_size = ReadUnsignedInt(&file_buf_ptr);
-  if (data_size + (file_buf_ptr - file_buf_head) != file_size) {
+  const size_t data_size = ReadUnsignedInt(&header_buf_ptr);
+  const size_t data_offset = header_buf_ptr - header_buf;
+  if (file_size != kUnknownSize && data_size != kUnknownSize &&
+      data_size + data_offset != file_size) {
     cerr << "Invalid data size." << endl;
     return -1;
   }
@@ -178,27 +200,61 @@ int main(int argc, char *argv[]) {
   const int kVolumeDiffThreshold = 2;
   const int minimum_mute_chunk_threshold = sampling_rate / 100;  // 10msec
   int mute_counter = 0;
-  const size_t max_sampling_count = data_size / (sampling_bytes * channel_num);
-
-  for (size_t sampling_counter = 0; sampling_counter < max_sampling_count;
-       ++sampling_counter) {
-    const int left_sound = ReadNumber(&file_buf_ptr, sampling_bytes);
-    const int right_sound = ReadNumber(&file_buf_ptr, sampling_bytes);
-
-    if (abs(left_sound) <= kVolumeThreshold &&
-        abs(right_sound) <= kVolumeThreshold) {
-      ++mute_counter;
-      if (mute_counter == minimum_mute_chunk_threshold) {
-        mute_ranges.push_back(
-            make_pair(sampling_counter - minimum_mute_chunk_threshold + 1,
-                      max_sampling_count));
-      }
-    } else {
-      if (mute_counter >= minimum_mute_chunk_threshold) {
-        mute_ranges.back().second = sampling_counter - 1;
+  // The end of a mute range lasting to the end of input. The number of
+  // samples is known only at the end of input.
+  const size_t kEndOfInput = static_cast<size_t>(-1);
+
+  // Samples are processed in blocks of bounded memory. Bytes after the
+  // header in the first block are moved to the head of the buffer.
+  const size_t kBufferBlockNum = 16384;
+  vector<char> data_buf(block_size * kBufferBlockNum + 1);
+  size_t buffered_size = header_buf_size - data_offset;
+  memcpy(&data_buf[0], header_buf + data_offset, buffered_size);
+  size_t remaining_data_size = data_size;
+  size_t sampling_counter = 0;
+  while (true) {
+    buffered_size += ReadBytes(is, &data_buf[buffered_size],
+                               block_size * kBufferBlockNum - buffered_size);
+    if (remaining_data_size != kUnknownSize) {
+      buffered_size = min(buffered_size, remaining_data_size);
+    }
+    const size_t block_num = buffered_size / block_size;
+    if (block_num == 0) {
+      break;
+    }
+    for (size_t i = 0; i < block_num; ++i, ++sampling_counter) {
+      char *block_ptr = &data_buf[i * block_size];
+      const int left_sound = ReadNumber(&block_ptr, sampling_bytes);
+      const int right_sound = (channel_num > 1)
+        ? ReadNumber(&block_ptr, sampling_bytes)
+        : left_sound;
+
+      if (abs(left_sound) <= kVolumeThreshold &&
+          abs(right_sound) <= kVolumeThreshold) {
+        ++mute_counter;
+        if (mute_counter == minimum_mute_chunk_threshold) {
+          mute_ranges.push_back(
+              make_pair(sampling_counter - minimum_mute_chunk_threshold + 1,
+                        kEndOfInput));
+        }
+      } else {
+        if (mute_counter >= minimum_mute_chunk_threshold) {
+          mute_ranges.back().second = sampling_counter - 1;
+        }
+        mute_counter = 0;
       }
-      mute_counter = 0;
     }
+
+    const size_t processed_size = block_num * block_size;
+    if (remaining_data_size != kUnknownSize) {
+      remaining_data_size -= processed_size;
+    }
+    buffered_size -= processed_size;
+    memmove(&data_buf[0], &data_buf[processed_size], buffered_size);
+  }
+  const size_t max_sampling_count = sampling_counter;
+  if (!mute_ranges.empty() && mute_ranges.back().second == kEndOfInput) {
+    mute_ranges.back().second = max_sampling_count;
   }
 
   const size_t concat_threshold = sampling_rate / 1000;  // 1msec
@@ -233,7 +289,5 @@ int main(int argc, char *argv[]) {
          << SamplingToTime(end, sampling_rate) << endl;
   }
 
-  delete [] file_buf_head;
-
   return 0;
 }
@@ -202,25 +202,13 @@ bool IsWhiteAreaNumberGreaterThanThreshold(int size_threshold,
   return false;
 }
 
-int main(int argc, char *argv[]) {
-  if (argc != 3) {
-    cerr << "Please specify input / output" << endl;
-    return -1;
-  }
-  const string input_filename = argv[1];
-  const string output_filename = argv[2];
-
-  if (!LoadImage(input_filename)) {
-    cerr << "Could not load " << input_filename << endl;
-    return -1;
-  }
-
+bool ConvertImage(const string &output_filename) {
   // Early exit to improve performance.
   ClearVisitedField();
   if (!IsWhiteAreaNumberGreaterThanThreshold(
           SMALL_WHITE_AREA_SIZE_THRESHOLD, SPONSOR_MARK_AREA_NUM)) {
     // Could not find a sponsor logo candidate.
-    return 1;
+    return false;
   }
 
   ClearVisitedField();
@@ -240,12 +228,36 @@ int main(int argc, char *argv[]) {
   ClearVisitedField();
   if (!IsWhiteAreaNumberGreaterThanThreshold(1, SPONSOR_MARK_AREA_NUM)) {
     // Could not find a sponsor logo candidate.
-    return 1;
+    return false;
   }
 
   OutputImage(output_filename);
-
-  return 0;
+  return true;
 }
 
+int main(int argc, char *argv[]) {
+  if (argc < 3 || argc % 2 != 1) {
+    cerr << "Please specify input / output [input / output ...]" << endl;
+    return -1;
+  }
+
+  // Multiple pairs save process launches. Only candidates are written, so
+  // callers check the existence of each output.
+  const bool is_single_image = (argc == 3);
+  int result = 0;
+  for (int i = 1; i < argc; i += 2) {
+    const string input_filename = argv[i];
+    const string output_filename = argv[i + 1];
 
+    if (!LoadImage(input_filename)) {
+      cerr << "Could not load " << input_filename << endl;
+      result = -1;
+      continue;
+    }
+    if (!ConvertImage(output_filename) && is_single_image) {
+      // Could not find a sponsor logo candidate.
+      return 1;
+    }
+  }
+  return result;
+}
@@ -1,8 +1,22 @@
 #!/usr/bin/python
 # coding: UTF-8
 
+import collections
+import cv2
+import functools
+import logging
+import multiprocessing
+import multiprocessing.pool
+import optparse
 import os
 import subprocess
+import sys
+import tempfile
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import result_cache
+import stage_timer
 
 
 _RESULT_FILENAME = 'sponsor.txt'
@@ -10,6 +24,30 @@ _CONVERTED_FILENAME_PREFIX = 'converted_'
 _TESSERACT_WHITELIST = u'提供' + u''.join(
     [unichr(c) for c in range(ord(u'あ'), ord(u'ん') + 1)] +
     [unichr(c) for c in range(ord(u'ァ'), ord(u'ン') + 1)])
+# The max number of images handled by one sponsor_detector / tesseract.
+_MAX_BATCH_SIZE = 32
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('--jobs', dest='jobs', type='int', default=1,
+                      help=('The number of images handled concurrently.'
+                            ' 0 means the number of CPUs.'))
+    parser.add_option('--cache_dir', dest='cache_dir', default='',
+                      help=('Directory of the result cache shared across'
+                            ' runs. Disabled if empty.'))
+    parser.add_option('--cache_size', dest='cache_size', type='int',
+                      default=result_cache.DEFAULT_MAX_ENTRIES,
+                      help='The max number of entries in the result cache.')
+    (options, _) = parser.parse_args(args)
+
+    if options.jobs < 0:
+        raise ValueError('The number of jobs should not be negative.')
+    if options.cache_size <= 0:
+        raise ValueError('Cache size should be positive.')
+    if options.jobs == 0:
+        options.jobs = multiprocessing.cpu_count()
+    return options
 
 
 def GetSponsorMarkDumpDirname():
@@ -27,33 +65,116 @@ def GetTargetFiles():
     return [f for f in filenames if os.path.isfile(f)]
 
 
-def ConvertFile(filename):
-    converted_filename = os.path.join(
+def GetConvertedFilename(filename):
+    return os.path.join(
         os.path.dirname(filename), '%s%s' % (
             _CONVERTED_FILENAME_PREFIX, os.path.basename(filename)))
-    script_dirname = os.path.dirname(os.path.abspath(__file__))
-    ret = subprocess.call([
-        '%s/%s' % (script_dirname, 'sponsor_detector'),
-        filename,
-        converted_filename,
-    ])
-    return converted_filename if not ret else None
 
 
-def IsSponsorImage(filename):
+def ConvertFiles(filenames):
+    converted_filenames = [GetConvertedFilename(f) for f in filenames]
+    command = [
+        '%s/%s' % (os.path.dirname(os.path.abspath(__file__)),
+                   'sponsor_detector')]
+    for (filename, converted_filename) in zip(filenames, converted_filenames):
+        # sponsor_detector writes candidates only.
+        if os.path.exists(converted_filename):
+            os.remove(converted_filename)
+        command.extend([filename, converted_filename])
+    subprocess.call(command)
+    return [f if os.path.isfile(f) else None for f in converted_filenames]
+
+
+def RecognizeTexts(filenames):
+    if not filenames:
+        return []
+
     utf8_env = {
         'LANG': 'ja_JP.UTF-8',
         'LC_ALL': 'ja_JP.UTF-8',
     }
+    list_filename = None
+    if len(filenames) == 1:
+        input_filename = filenames[0]
+    else:
+        # tesseract handles a text file of image paths as a multi-page input
+        # and separates pages by form feeds.
+        (fd, list_filename) = tempfile.mkstemp(
+            suffix='.txt', dir=os.path.dirname(filenames[0]))
+        with os.fdopen(fd, 'w') as list_file:
+            for filename in filenames:
+                list_file.write('%s\n' % os.path.abspath(filename))
+        input_filename = list_filename
     command = [
         'tesseract',
-        filename,
+        input_filename,
         'stdout',
         '-l', 'jpn',
         '-psm', '6',
-        '-c', u'tessedit_char_whitelist=%s' % _TESSERACT_WHITELIST]
-    output = subprocess.check_output(command, env = utf8_env).decode('utf-8')
-    return 0 <= output.find(u'提') < output.find(u'供')
+        '-c', (u'tessedit_char_whitelist=%s' %
+               _TESSERACT_WHITELIST).encode('utf-8')]
+    try:
+        output = subprocess.check_output(
+            command, env = utf8_env).decode('utf-8')
+    finally:
+        if list_filename is not None:
+            os.remove(list_filename)
+
+    if len(filenames) == 1:
+        return [output]
+    texts = output.split(u'\f')
+    if len(texts) < len(filenames):
+        # Unexpected page separation. Recognize images one by one.
+        return [RecognizeTexts([f])[0] for f in filenames]
+    return texts[:len(filenames)]
+
+
+def IsSponsorText(text):
+    return 0 <= text.find(u'提') < text.find(u'供')
+
+
+def IsSponsorImages(filenames, cache=None):
+    if cache is None:
+        return [IsSponsorText(text) for text in RecognizeTexts(filenames)]
+
+    # The same sponsor cards appear every week. Skip OCR for them.
+    keys = [result_cache.CalcPerceptualHash(
+                cv2.imread(f, cv2.IMREAD_GRAYSCALE)) for f in filenames]
+    results = cache.GetMany(keys)
+    missed = [i for (i, result) in enumerate(results) if result is None]
+    texts = RecognizeTexts([filenames[i] for i in missed])
+    for (i, text) in zip(missed, texts):
+        results[i] = IsSponsorText(text)
+    cache.PutMany([(keys[i], results[i]) for i in missed])
+    return results
+
+
+def IsSponsorImage(filename, cache=None):
+    return IsSponsorImages([filename], cache)[0]
+
+
+def DetectSponsorImages(filenames, cache=None):
+    converted_filenames = ConvertFiles(filenames)
+    targets = [f for f in converted_filenames if f]
+    detected = dict(zip(targets, IsSponsorImages(targets, cache)))
+    return [f is not None and detected[f] for f in converted_filenames]
+
+
+def GetIndex(filename):
+    return os.path.splitext(os.path.basename(filename))[0].split('_')[0]
+
+
+def MergeSponsorResults(filenames, detected):
+    # Marks sampled around silence ranges are named as index_subindex. An
+    # index is a sponsor if any of its marks is. Returns lines of indices in
+    # the order of |filenames|.
+    is_sponsor_indices = collections.OrderedDict()
+    for (filename, is_sponsor) in zip(filenames, detected):
+        index = GetIndex(filename)
+        is_sponsor_indices[index] = (
+            is_sponsor_indices.get(index, False) or is_sponsor)
+    return ['%s %s' % (index, is_sponsor)
+            for (index, is_sponsor) in is_sponsor_indices.iteritems()]
 
 
 def OutputToFile(filename, lines):
@@ -63,17 +184,33 @@ def OutputToFile(filename, lines):
 
 
 def Main():
+    options = ParseOptions()
     original_filenames = GetTargetFiles()
-    result = []
-    for filename in original_filenames:
-        converted_filename = ConvertFile(filename)
-        index = os.path.splitext(os.path.basename(filename))[0]
-        if not converted_filename or not IsSponsorImage(converted_filename):
-            result.append('%s False' % index)
-        else:
-            result.append('%s True' % index)
-    OutputToFile(_RESULT_FILENAME, result)
+
+    # Keep all workers busy even for a short movie.
+    batch_size = max(1, min(
+        _MAX_BATCH_SIZE, -(-len(original_filenames) // options.jobs)))
+    batches = [original_filenames[i:i + batch_size]
+               for i in xrange(0, len(original_filenames), batch_size)]
+    cache = result_cache.OpenResultCache(
+        options.cache_dir, 'sponsor', options.cache_size)
+    pool = multiprocessing.pool.ThreadPool(options.jobs)
+    try:
+        # Results are in the order of batches.
+        with stage_timer.Span('ocr'):
+            detected_list = pool.map(
+                functools.partial(DetectSponsorImages, cache=cache), batches)
+    finally:
+        pool.close()
+        pool.join()
+        if cache is not None:
+            cache.Close()
+
+    OutputToFile(_RESULT_FILENAME, MergeSponsorResults(
+        original_filenames,
+        [is_sponsor for detected in detected_list for is_sponsor in detected]))
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     Main()
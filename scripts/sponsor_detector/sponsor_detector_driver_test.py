@@ -0,0 +1,45 @@
+#!/usr/bin/python
+
+import random
+import unittest
+
+import sponsor_detector_driver
+
+
+class SponsorDetectorDriverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(0)
+
+    def testGetIndex(self):
+        self.assertEqual('000012', sponsor_detector_driver.GetIndex(
+            'sponsor_dump/000012.png'))
+        self.assertEqual('000012', sponsor_detector_driver.GetIndex(
+            'sponsor_dump/000012_03.png'))
+
+    def testMergeSponsorResultsOfDump(self):
+        # The baseline wrote a line per dumped file.
+        filenames = ['sponsor_dump/%06d.png' % i for i in xrange(1, 30)]
+        detected = [self.random.random() < 0.3 for _ in filenames]
+        self.assertEqual(
+            ['%06d %s' % (i, is_sponsor)
+             for (i, is_sponsor) in enumerate(detected, 1)],
+            sponsor_detector_driver.MergeSponsorResults(filenames, detected))
+
+    def testMergeSponsorResultsOfSamples(self):
+        filenames = [
+            'sponsor_dump/000003_00.png',
+            'sponsor_dump/000003_01.png',
+            'sponsor_dump/000004_00.png',
+            'sponsor_dump/000004_01.png',
+            'sponsor_dump/000004_02.png',
+            'sponsor_dump/000010_00.png',
+        ]
+        self.assertEqual(
+            ['000003 True', '000004 False', '000010 True'],
+            sponsor_detector_driver.MergeSponsorResults(
+                filenames, [False, True, False, False, False, True]))
+
+
+if __name__ == '__main__':
+    unittest.main()
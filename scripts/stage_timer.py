@@ -0,0 +1,217 @@
+#!/usr/bin/python
+
+# Runs a command of a mecenc stage and appends its wall time, CPU time,
+# peak RSS and bytes written to the working directory to timings.json.
+# Python scripts of the stage can add sub-phase spans by Span().
+
+import contextlib
+import fcntl
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SPAN_FILENAME_ENV = 'MECENC_SPAN_FILE'
+PROMETHEUS_METRICS = (
+    ('wall_seconds', 'Wall time of the stage.'),
+    ('user_seconds', 'User CPU time of the stage.'),
+    ('system_seconds', 'System CPU time of the stage.'),
+    ('max_rss_kb', 'Peak RSS of the largest process of the stage in KiB.'),
+    ('bytes_written', 'Growth of the working directory in bytes.'),
+    ('returncode', 'Return code of the stage.'),
+)
+
+
+def GetCpuSeconds():
+    # CPU time of this process and its waited children, e.g. workers of a
+    # joined pool, ffmpeg and OCR processes.
+    cpu_seconds = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        cpu_seconds = cpu_seconds + usage.ru_utime + usage.ru_stime
+    return cpu_seconds
+
+
+@contextlib.contextmanager
+def Span(name):
+    # Records a sub-phase if the script runs under stage_timer.py, also when
+    # the block raises.
+    span_filename = os.environ.get(SPAN_FILENAME_ENV)
+    start_time = time.time()
+    start_cpu_seconds = GetCpuSeconds()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        if span_filename:
+            span = {
+                'name': name,
+                'start': start_time,
+                'wall_seconds': time.time() - start_time,
+                'cpu_seconds': GetCpuSeconds() - start_cpu_seconds,
+                # Peaks of the process lifetime until the end of the span,
+                # not of the span itself. KiB on Linux.
+                'max_rss_kb': resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss,
+                'children_max_rss_kb': resource.getrusage(
+                    resource.RUSAGE_CHILDREN).ru_maxrss,
+                'failed': failed,
+            }
+            with open(span_filename, 'a') as span_file:
+                span_file.write('%s\n' % json.dumps(span))
+
+
+def ParseOptions(args=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] -- command')
+    parser.add_option('--name', dest='name', default=None,
+                      help='Stage name. The command name by default.')
+    parser.add_option('--timings', dest='timings', default='timings.json',
+                      help='JSON file to append the result to.')
+    parser.add_option('--prometheus_textfile', dest='prometheus_textfile',
+                      default=None,
+                      help=('Prometheus textfile to write all stages in'
+                            ' --timings to. Series of other recordings in'
+                            ' the file are kept.'))
+    parser.add_option('--recording', dest='recording', default='',
+                      help='Recording label of series in the textfile.')
+    (options, args) = parser.parse_args(args)
+
+    if len(args) != 1:
+        raise ValueError('Specify one command to run.')
+    options.command = args[0]
+    if options.name is None:
+        options.name = os.path.basename(options.command.split()[0])
+    return options
+
+
+def GetDirectorySize(dirname):
+    size = 0
+    for (root, _, filenames) in os.walk(dirname):
+        for filename in filenames:
+            try:
+                size = size + os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                # Removed while walking.
+                pass
+    return size
+
+
+def RunStage(options):
+    (fd, span_filename) = tempfile.mkstemp(prefix='mecenc_span')
+    os.close(fd)
+    env = dict(os.environ)
+    env[SPAN_FILENAME_ENV] = span_filename
+
+    start_size = GetDirectorySize('.')
+    start_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start_time = time.time()
+    try:
+        returncode = subprocess.call(options.command, shell=True, env=env)
+        wall_time = time.time() - start_time
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with open(span_filename) as span_file:
+            spans = [json.loads(line) for line in span_file if line.strip()]
+    finally:
+        os.remove(span_filename)
+
+    return {
+        'name': options.name,
+        'command': options.command,
+        'start': start_time,
+        'returncode': returncode,
+        'wall_seconds': wall_time,
+        'user_seconds': usage.ru_utime - start_usage.ru_utime,
+        'system_seconds': usage.ru_stime - start_usage.ru_stime,
+        # The largest process of the stage. KiB on Linux.
+        'max_rss_kb': usage.ru_maxrss,
+        # Growth of the working directory. Negative if files are removed.
+        'bytes_written': GetDirectorySize('.') - start_size,
+        'spans': spans,
+    }
+
+
+def LoadTimings(filename):
+    if not os.path.isfile(filename):
+        return {'stages': []}
+    with open(filename) as input_file:
+        return json.load(input_file)
+
+
+def WriteAtomically(filename, content):
+    # Readers never see a partial file.
+    dirname = os.path.dirname(os.path.abspath(filename))
+    (fd, temp_filename) = tempfile.mkstemp(dir=dirname)
+    with os.fdopen(fd, 'w') as output_file:
+        output_file.write(content)
+    os.chmod(temp_filename, 0644)
+    os.rename(temp_filename, filename)
+
+
+def EscapeLabelValue(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def LoadPrometheusSamples(filename, recording):
+    # Returns a map from metric names to sample lines of recordings other
+    # than |recording| in |filename|. The recording label comes first.
+    samples = {}
+    if not os.path.isfile(filename):
+        return samples
+    label = '{recording="%s",' % EscapeLabelValue(recording)
+    with open(filename) as input_file:
+        for line in input_file:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#') or label in line:
+                continue
+            samples.setdefault(line.split('{')[0], []).append(line)
+    return samples
+
+
+def FormatPrometheusMetrics(timings, recording, other_samples):
+    lines = []
+    for (key, description) in PROMETHEUS_METRICS:
+        metric_name = 'mecenc_stage_%s' % key
+        lines.append('# HELP %s %s' % (metric_name, description))
+        lines.append('# TYPE %s gauge' % metric_name)
+        lines.extend(other_samples.get(metric_name, []))
+        # The same command may run more than once. e.g. scene_filter.
+        for (i, stage) in enumerate(timings['stages']):
+            lines.append('%s{recording="%s",stage="%s",index="%d"} %s' % (
+                metric_name, EscapeLabelValue(recording), stage['name'], i,
+                stage[key]))
+    return '\n'.join(lines) + '\n'
+
+
+def WritePrometheusTextfile(filename, timings, recording):
+    # Stages of recordings analyzed and encoded at the same time write the
+    # same file. Node exporter reads only *.prom files, not the lock.
+    with open('%s.lock' % filename, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        WriteAtomically(filename, FormatPrometheusMetrics(
+            timings, recording, LoadPrometheusSamples(filename, recording)))
+
+
+def Main():
+    options = ParseOptions()
+    stage = RunStage(options)
+
+    timings = LoadTimings(options.timings)
+    timings['stages'].append(stage)
+    WriteAtomically(options.timings,
+                    json.dumps(timings, indent=2, sort_keys=True) + '\n')
+    if options.prometheus_textfile:
+        WritePrometheusTextfile(
+            options.prometheus_textfile, timings, options.recording)
+
+    sys.exit(stage['returncode'])
+
+
+if __name__ == '__main__':
+    Main()
@@ -403,14 +403,63 @@ bool FileExists(const string &filename) {
   return ifs.good();
 }
 
+// Returns the offset of the first PAT of the cleaned stream in |data|, or -1.
+long FindStartOffset(const char *data, size_t size) {
+  int movie_element_id = -1;
+  {  // Determine the stream ID.
+    const size_t offset = ((size / 2) / TS_PACKET_SIZE) * TS_PACKET_SIZE;
+    TsIterator ts_iterator(data + offset, size - offset);
+    while (movie_element_id == -1) {
+      if (!ts_iterator.Next(TsPacket::PMT)) {
+        cerr << "Failed to find PMT packet." << endl;
+        return -1;
+      }
+      const TsPmtPacket *packet =
+        dynamic_cast<const TsPmtPacket *>(ts_iterator.GetTsPacket());
+      movie_element_id = packet->GetFirstMovieId();
+    }
+  }
+
+  // Detect first packet.
+  size_t found_pos = 0;
+  TsIterator ts_iterator(data, size);
+
+  // Usually, A TOT packet is in each 5 seconds.
+  // Skip packets before hh:mm:55.
+  const TsTotPacket *tot_packet = nullptr;
+  do {
+    ts_iterator.Next(TsPacket::TOT);
+    tot_packet = dynamic_cast<const TsTotPacket *>(ts_iterator.GetTsPacket());
+  } while (tot_packet->GetSeconds() > 15);  // 5sec is enough, but for safety.
+  ts_iterator.Previous(TsPacket::TOT);
+
+  while (ts_iterator.Next(TsPacket::PMT)) {
+    const TsPmtPacket *pmt_packet =
+      dynamic_cast<const TsPmtPacket *>(ts_iterator.GetTsPacket());
+    if (pmt_packet->GetFirstMovieId() == movie_element_id) {
+      found_pos = ts_iterator.GetCurrentOffset();
+      break;
+    }
+  }
+
+  ts_iterator.Previous(TsPacket::PAT);
+  if (found_pos > ts_iterator.GetCurrentOffset()) {
+    ts_iterator.Next(TsPacket::PAT);
+  }
+  return ts_iterator.GetCurrentOffset();
+}
+
 int main(int argc, char *argv[]) {
+  // With --index, only the number of bytes to skip from the head of the
+  // input is written, so that readers can read the input file in place.
+  const bool is_index_mode = argc == 3 && string(argv[1]) == "--index";
   if (argc != 3) {
     cerr << "Please specify the input/output file." << endl;
     return 1;
   }
 
-  const string input_filename = argv[1];
-  const string output_filename = argv[2];
+  const string input_filename = argv[is_index_mode ? 2 : 1];
+  const string output_filename = is_index_mode ? "-" : argv[2];
 
   const bool use_stdin = input_filename == "-";
   const bool use_stdout = output_filename == "-";
@@ -445,53 +494,19 @@ int main(int argc, char *argv[]) {
   const size_t file_content_buf_size = TS_PACKET_SIZE * kTotalPacketNum;
   unique_ptr<char []> file_content(new char[file_content_buf_size]);
   input_stream->read(file_content.get(), file_content_buf_size);
-  const size_t loaded_size = input_stream->tellg();
+  // tellg() fails on a pipe and on inputs shorter than the chunk.
+  const size_t loaded_size = input_stream->gcount();
 
-  int movie_element_id = -1;
-  {  // Determine the stream ID.
-    const size_t offset = ((loaded_size / 2) / TS_PACKET_SIZE) * TS_PACKET_SIZE;
-    TsIterator ts_iterator(file_content.get() + offset, loaded_size - offset);
-    while (movie_element_id == -1) {
-      if (!ts_iterator.Next(TsPacket::PMT)) {
-        cerr << "Failed to find PMT packet." << endl;
-        return -1;
-      }
-      const TsPmtPacket *packet =
-        dynamic_cast<const TsPmtPacket *>(ts_iterator.GetTsPacket());
-      movie_element_id = packet->GetFirstMovieId();
-    }
+  const long start_offset = FindStartOffset(file_content.get(), loaded_size);
+  if (start_offset < 0) {
+    return -1;
   }
-
-  {  // Detect first packet and write.
-    size_t found_pos = 0;
-    TsIterator ts_iterator(file_content.get(), loaded_size);
-
-    // Usually, A TOT packet is in each 5 seconds.
-    // Skip packets before hh:mm:55.
-    const TsTotPacket *tot_packet = nullptr;
-    do {
-      ts_iterator.Next(TsPacket::TOT);
-      tot_packet = dynamic_cast<const TsTotPacket *>(ts_iterator.GetTsPacket());
-    } while (tot_packet->GetSeconds() > 15);  // 5sec is enough, but for safety.
-    ts_iterator.Previous(TsPacket::TOT);
-
-    while (ts_iterator.Next(TsPacket::PMT)) {
-      const TsPmtPacket *pmt_packet =
-        dynamic_cast<const TsPmtPacket *>(ts_iterator.GetTsPacket());
-      if (pmt_packet->GetFirstMovieId() == movie_element_id) {
-        found_pos = ts_iterator.GetCurrentOffset();
-        break;
-      }
-    }
-
-    ts_iterator.Previous(TsPacket::PAT);
-    if (found_pos > ts_iterator.GetCurrentOffset()) {
-      ts_iterator.Next(TsPacket::PAT);
-    }
-    const size_t start_offset = ts_iterator.GetCurrentOffset();
-    output_stream->write(
-        file_content.get() + start_offset, loaded_size - start_offset);
+  if (is_index_mode) {
+    *output_stream << start_offset << endl;
+    return 0;
   }
+  output_stream->write(
+      file_content.get() + start_offset, loaded_size - start_offset);
 
   // Write a trailing content.
   while (input_stream->good()) {
@@ -9,8 +9,11 @@ use File::Spec;
 use Getopt::Long;
 
 my %options;
-GetOptions(\%options, qw/aggressive_analysis/)
+GetOptions(\%options,
+           qw/aggressive_analysis follow direct logo_info=s cache_dir=s/)
     or die 'Failed to parse options on ts_dumper.';
+die 'Cannot use --follow with --direct.'
+    if $options{follow} && $options{direct};
 
 my $script_dirname = File::Basename::dirname(File::Spec->rel2abs($0));
 $script_dirname =~ s/ /\\ /g;
@@ -21,10 +24,12 @@ die "Input file should be ts or m2ts or mp4."
     unless $input_filename =~ m%([^/]+)\.(ts|m2ts|mp4|ts\.filepart)$%;
 my $basename = $1;
 my $movie_filename = "in.mp4v";
-my $audio_filename = "in.wav";
+my $index_filename = "in.index";
+my $audio_filename = "in.aac";
 my $raw_silence_filename = "raw_silence.txt";
 my $silence_filename = "silence.txt";
 die "A file already exists. [$movie_filename]" if -e $movie_filename;
+die "A file already exists. [$index_filename]" if -e $index_filename;
 die "A file already exists. [$audio_filename]" if -e $audio_filename;
 die "A file already exists. [$raw_silence_filename]"
     if -e $raw_silence_filename;
@@ -41,19 +46,80 @@ if ($input_filename =~ m/\.mp4$/) {
 }
 
 my $aggressive_analysis = $options{aggressive_analysis};
-
-system(
-    qq|$clean_command ffmpeg -i $ffmpeg_input| .
-    qq| -an -vcodec copy -f mp4 "$movie_filename"| .
-    qq| -vn -acodec pcm_s24le -f wav "$audio_filename"|) and die;
 my $silence_detector_options =
     $aggressive_analysis ? '--aggressive_analysis' : '';
-system(
-    qq|$script_dirname/silence_detector/silence_detector| .
-    qq| $silence_detector_options "$audio_filename"| .
-    qq| > "$raw_silence_filename"|) and die;
+
+# The original audio stream is kept for encoder.pl. Silence is detected on
+# decoded PCM through a pipe so that the large wav is never written.
+if ($options{follow}) {
+    die "Only ts can be followed." unless $clean_command;
+    # Fields are analyzed while the recording is still being written.
+    my $live_dumper_options = $silence_detector_options;
+    $live_dumper_options .= qq| --logo_info="$options{logo_info}"|
+        if defined $options{logo_info};
+    $live_dumper_options .= qq| --cache_dir="$options{cache_dir}"|
+        if defined $options{cache_dir};
+    system(
+        qq#$script_dirname/follow_reader.py "$input_filename" |# .
+        qq# $script_dirname/ts_cleaner/ts_cleaner - - |# .
+        qq# $script_dirname/live_dumper.py $live_dumper_options#) and die;
+} elsif ($options{direct}) {
+    # The video is read in place from the input file instead of in.mp4v.
+    my $skip_initial_bytes = 0;
+    if ($clean_command) {
+        $skip_initial_bytes =
+            `$script_dirname/ts_cleaner/ts_cleaner --index "$input_filename"`;
+        chomp $skip_initial_bytes;
+        die "Failed to index. [$input_filename]"
+            unless $skip_initial_bytes =~ m/^\d+$/;
+    }
+    my $absolute_input_filename = File::Spec->rel2abs($input_filename);
+    my $input_option = qq|-skip_initial_bytes $skip_initial_bytes| .
+        qq| -i "$absolute_input_filename"|;
+    system(
+        qq#ffmpeg $input_option# .
+        qq# -vn -acodec copy -f adts "$audio_filename"# .
+        qq# -vn -acodec pcm_s24le -f wav pipe:1 |# .
+        qq# $script_dirname/silence_detector/silence_detector# .
+        qq# $silence_detector_options - > "$raw_silence_filename"#) and die;
+    my $video_start = getVideoStart($input_option);
+    open my $index_fh, '>', $index_filename
+        or die "Failed to open $index_filename.";
+    print $index_fh "input\t$absolute_input_filename\n";
+    print $index_fh "skip_initial_bytes\t$skip_initial_bytes\n";
+    print $index_fh "video_start\t$video_start\n";
+    close $index_fh;
+} else {
+    system(
+        qq#$clean_command ffmpeg -i $ffmpeg_input# .
+        qq# -an -vcodec copy -f mp4 "$movie_filename"# .
+        qq# -vn -acodec copy -f adts "$audio_filename"# .
+        qq# -vn -acodec pcm_s24le -f wav pipe:1 |# .
+        qq# $script_dirname/silence_detector/silence_detector# .
+        qq# $silence_detector_options - > "$raw_silence_filename"#) and die;
+}
+# Only the exit status of the last command of the pipeline is checked.
+my $video_output_filename =
+    $options{direct} ? $index_filename : $movie_filename;
+for my $filename (
+        $video_output_filename, $audio_filename, $raw_silence_filename) {
+    die "Failed to dump. [$filename]" unless -s $filename;
+}
+# Seeks of analysis and encoding start at keyframes in the index.
+system(qq|$script_dirname/frame_index.py|) and die;
 if ($aggressive_analysis) {
     system(qq|cp "$raw_silence_filename" "$silence_filename"|) and die;
 } else {
     system(qq|$script_dirname/simple_silence_filter.pl|) and die;
 }
+
+# Returns the time of the first video frame from the start of the input.
+# Decoders count frames from it while audio starts at the input start.
+sub getVideoStart {
+    my $input_option = shift;
+    my $output =
+        `ffmpeg $input_option -vframes 1 -filter:v showinfo -an -f null - 2>&1`;
+    die "Failed to probe the video start." unless
+        $output =~ m/\sn:\s*0\s+pts:\s*-?\d+\s+pts_time:\s*(-?[\d.]+)/;
+    return sprintf('%.6f', $1);
+}